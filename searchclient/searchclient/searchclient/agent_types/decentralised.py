@@ -11,10 +11,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import itertools
+from search_algorithms.cooperative_search import ReservationTable, cooperative_search
 from search_algorithms.serial_graph_search import serial_graph_search
 from utils import *
 
+# Whether the agents plan in priority order around the cells reserved by the agents before them (see
+# reservation_table_agent_type). The searchclient sets this from the command line.
+use_reservation_table = False
+# The maximum number of priority orders tried by reservation_table_agent_type
+MAX_PRIORITY_ORDERS = 10
+
 def decentralised_agent_type(level, initial_state, action_library, goal_description, frontier):
+    if use_reservation_table:
+        reservation_table_agent_type(level, initial_state, action_library, goal_description, frontier)
+        return
+
     # Create an action set where all agents can perform all actions
     action_set = [action_library] * level.num_agents
 
@@ -65,7 +77,113 @@ def decentralised_agent_type(level, initial_state, action_library, goal_descript
             if execution_successes[agent_index] and any(plan[agent_index]):
                 plan[agent_index].pop(0)
 
-    
 
+def next_priority_order(priority_order, failed_color, tried_orders):
+    """
+    Returns the priority order to try after the failed color found no plan, which is the order with the failed color
+    moved to the front, or to the back if it already is in front, unless that order has been tried. Otherwise, the
+    first order which has not been tried is returned, or None if MAX_PRIORITY_ORDERS orders have been tried.
+    """
+    if len(tried_orders) >= MAX_PRIORITY_ORDERS:
+        return None
+    other_colors = [color for color in priority_order if color != failed_color]
+    if priority_order[0] != failed_color:
+        preferred_order = [failed_color] + other_colors
+    else:
+        preferred_order = other_colors + [failed_color]
+    for order in itertools.chain([preferred_order], itertools.permutations(priority_order)):
+        if tuple(order) not in tried_orders:
+            return list(order)
+    return None
+
+
+def reservation_table_agent_type(level, initial_state, action_library, goal_description, frontier):
+    """
+    Cooperative A*: The agents of every color plan in priority order, initially given by the lowest agent number of
+    the color, using a space-time search around the cells reserved by the plans of the colors before them (see
+    cooperative_search). Every plan then reserves its own cells, so the combined plan is conflict free before it is
+    sent, and every color is only searched once. The cells of the colors which have not planned yet stay reserved
+    until they do, and the boxes of colors without agents are obstacles to all colors.
+    Since the final cells of a plan stay reserved forever, every color first searches for a plan which ends without
+    covering a goal cell of the colors after it or cutting it off from their agents, and only falls back to any plan
+    if there is none.
+    If a color finds no plan, it is moved to the front of the priority order, or to the back if it already is in front
+    and therefore only blocked by colors without a plan, and the colors plan again. If that order has already been
+    tried, the first order which has not is used instead. At most MAX_PRIORITY_ORDERS orders are tried.
+    Colors whose plans must interleave, e.g. because one color must move a box out of a corridor which another color
+    must pass before the box can be put on its goal in the same corridor, cannot be solved in any priority order.
+    """
+    agent_colors = []
+    for agent_char in initial_state.agent_chars:
+        if level.colors[agent_char] not in agent_colors:
+            agent_colors.append(level.colors[agent_char])
+    immovable_colors = {level.colors[box_char] for box_char in initial_state.box_chars} - set(agent_colors)
+    color_states = {color: initial_state.colors_filter({color} | immovable_colors) for color in agent_colors}
+
+    # The goals which the plans of the other colors must keep reachable, as (agent cells, goal cells) pairs
+    color_goals = {}
+    for color in agent_colors:
+        agent_cells = [level.cell_of(agent_position)
+                       for (agent_position, agent_char) in initial_state.agent_positions
+                       if level.colors[agent_char] == color]
+        goal_cells = [goal_cell for (goal_cell, _, _) in goal_description.colors_filter({color}).goal_cells]
+        color_goals[color] = (agent_cells, goal_cells)
+
+    priority_order = list(agent_colors)
+    tried_orders = {tuple(priority_order)}
+    color_plans = {}
+    while len(color_plans) < len(agent_colors):
+        reservation_table = ReservationTable()
+        for color in priority_order:
+            reservation_table.reserve_static(color_states[color])
+
+        color_plans = {}
+        for (index, color) in enumerate(priority_order):
+            color_state = color_states[color]
+            reservation_table.release_static(color_state)
+            action_set = [action_library] * len(color_state.agent_chars)
+            color_goal_description = goal_description.colors_filter({color})
+            protected_goals = [color_goals[later_color] for later_color in priority_order[index + 1:]]
+            success, color_plan = cooperative_search(color_state, action_set, color_goal_description, frontier,
+                                                     reservation_table, protected_goals)
+            if not success and len(protected_goals) > 0:
+                success, color_plan = cooperative_search(color_state, action_set, color_goal_description, frontier,
+                                                         reservation_table)
+            if not success:
+                priority_order = next_priority_order(priority_order, color, tried_orders)
+                if priority_order is None:
+                    print(f"Unable to find a plan for the {color} agents.", file=sys.stderr)
+                    return
+                tried_orders.add(tuple(priority_order))
+                print(f"No plan found for the {color} agents, planning in the order {', '.join(priority_order)}",
+                      file=sys.stderr, flush=True)
+                break
+            reservation_table.reserve_plan(color_state, color_plan)
+            color_plans[color] = color_plan
+
+    # The plans of the colors are combined into joint actions, where agents whose plan has ended perform NoOp
+    plan_length = max(len(color_plan) for color_plan in color_plans.values())
+    agent_actions = []
+    for agent_char in initial_state.agent_chars:
+        color = level.colors[agent_char]
+        agent_actions.append((color_plans[color], color_states[color].agent_chars.index(agent_char)))
+    no_op = GenericNoOp()
+    plan = [[color_plan[step][agent_index] if step < len(color_plan) else no_op
+             for (color_plan, agent_index) in agent_actions]
+            for step in range(plan_length)]
+
+    print("Found solution of length %d" % len(plan), file=sys.stderr)
 
-    
\ No newline at end of file
+    for joint_action in plan:
+        # Send the joint action to the server
+        print(joint_action_to_string(joint_action), flush=True)
+        # Uncomment the below line to print the executed actions to the command line for debugging purposes
+        # print(joint_action_to_string(joint_action), file=sys.stderr, flush=True)
+
+        # Read back whether the agents succeeded in performing the joint action
+        execution_successes = parse_response(read_line())
+        if False in execution_successes:
+            print("Execution failed! Stopping...", file=sys.stderr)
+            # One of the agents failed to execute their action.
+            # This should not occur in classical planning and we therefore just abort immediately
+            return
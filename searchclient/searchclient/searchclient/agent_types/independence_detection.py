@@ -0,0 +1,125 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+from search_algorithms.graph_search import graph_search
+from utils import *
+
+
+def independence_detection_agent_type(level, initial_state, action_library, goal_description, frontier):
+    """
+    Independence detection: The agents are split into groups, initially one group per color, and every group plans
+    on its own as if the other groups did not exist. The plans are then simulated together, and whenever the combined
+    plan fails, the two groups responsible are merged and planned for jointly. On levels where most agents never
+    interact, this replaces a single search over all agents by several small searches.
+    """
+    # Boxes of colors without any agents can never be moved, so they are obstacles in the states of all groups
+    agent_colors = {level.colors[agent_char] for agent_char in initial_state.agent_chars}
+    immovable_colors = {level.colors[box_char] for box_char in initial_state.box_chars} - agent_colors
+
+    groups = [frozenset([color]) for color in sorted(agent_colors)]
+    group_plans = {}
+    for group in groups:
+        group_plans[group] = plan_group(group, immovable_colors, initial_state, action_library, goal_description,
+                                        frontier)
+        if group_plans[group] is None:
+            print("Unable to solve level.", file=sys.stderr)
+            return
+
+    while True:
+        plan, failed_step = combine_and_simulate(initial_state, groups, group_plans, immovable_colors)
+        if failed_step is None:
+            break
+
+        # Merge the two groups whose plans fail together, or all groups if no two groups fail on their own
+        merged_groups = find_conflicting_groups(initial_state, groups, group_plans, immovable_colors, failed_step)
+        merged_group = frozenset().union(*merged_groups)
+        print(f"Merging groups {' and '.join(','.join(sorted(group)) for group in merged_groups)}", file=sys.stderr,
+              flush=True)
+        groups = [group for group in groups if group not in merged_groups] + [merged_group]
+        group_plans[merged_group] = plan_group(merged_group, immovable_colors, initial_state, action_library,
+                                               goal_description, frontier)
+        if group_plans[merged_group] is None:
+            print("Unable to solve level.", file=sys.stderr)
+            return
+
+    print("Found solution of length %d" % len(plan), file=sys.stderr)
+
+    for joint_action in plan:
+        # Send the joint action to the server
+        print(joint_action_to_string(joint_action), flush=True)
+        # Uncomment the below line to print the executed actions to the command line for debugging purposes
+        # print(joint_action_to_string(joint_action), file=sys.stderr, flush=True)
+
+        # Read back whether the agents succeeded in performing the joint action
+        execution_successes = parse_response(read_line())
+        if False in execution_successes:
+            print("Execution failed! Stopping...", file=sys.stderr)
+            # One of the agents failed to execute their action.
+            # This should not occur in classical planning and we therefore just abort immediately
+            return
+
+
+def plan_group(group, immovable_colors, initial_state, action_library, goal_description, frontier):
+    """Plans for the agents of the colors in the group on their own, and returns the plan or None if there is none"""
+    group_state = initial_state.colors_filter(group | immovable_colors)
+    group_goal = goal_description.colors_filter(group)
+    action_set = [action_library] * len(group_state.agent_chars)
+    success, plan = graph_search(group_state, action_set, group_goal, frontier)
+    if not success:
+        return None
+    return plan
+
+
+def combine_and_simulate(initial_state, groups, group_plans, immovable_colors, num_steps=None):
+    """
+    Combines the plans of the groups into a plan for all their agents, where agents whose group has completed its plan
+    perform NoOp, and simulates it from the initial state filtered to the groups. Returns the combined plan and the
+    index of the first joint action which is not applicable or conflicting, or None if the plan succeeds.
+    If num_steps is given, only that many joint actions are simulated.
+    """
+    colors = frozenset().union(*groups)
+    state = initial_state.colors_filter(colors | immovable_colors)
+
+    # The index of every agent in the plan of its group, whose agents are ordered just like in the full state
+    agent_actions = []
+    for agent_char in state.agent_chars:
+        for group in groups:
+            if initial_state.level.colors[agent_char] in group:
+                group_agent_chars = [char for char in state.agent_chars if state.level.colors[char] in group]
+                agent_actions.append((group_plans[group], group_agent_chars.index(agent_char)))
+                break
+
+    plan_length = max(len(group_plans[group]) for group in groups)
+    if num_steps is not None:
+        plan_length = min(plan_length, num_steps)
+    no_op = GenericNoOp()
+    plan = []
+    for step in range(plan_length):
+        joint_action = [group_plan[step][agent_index] if step < len(group_plan) else no_op
+                        for (group_plan, agent_index) in agent_actions]
+        if not state.is_applicable(joint_action) or state.is_conflicting(joint_action):
+            return plan, step
+        state = state.result(joint_action)
+        plan.append(joint_action)
+    return plan, None
+
+
+def find_conflicting_groups(initial_state, groups, group_plans, immovable_colors, failed_step):
+    """Returns two groups whose plans fail when combined on their own, or all groups if there are no such groups"""
+    for (group, other_group) in itertools.combinations(groups, 2):
+        _, pair_failed_step = combine_and_simulate(initial_state, [group, other_group], group_plans, immovable_colors,
+                                                   failed_step + 1)
+        if pair_failed_step is not None:
+            return [group, other_group]
+    return groups
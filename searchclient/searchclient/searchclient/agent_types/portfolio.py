@@ -0,0 +1,144 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+import queue
+import traceback
+import memory
+from search_algorithms.graph_search import graph_search
+from utils import *
+
+# The configurations raced by the portfolio agent type as (strategy, heuristic, action library) name triplets, where
+# a missing heuristic is None. The searchclient sets this from the command line (see parse_configurations).
+configurations = [('bfs', None, 'default'), ('greedy', 'advanced', 'default'), ('astar', 'goalcount', 'default')]
+# The names accepted in the configurations, which match the command line arguments of the searchclient
+STRATEGY_NAMES = ('bfs', 'dfs', 'astar', 'greedy', 'idastar', 'arastar', 'beam')
+HEURISTIC_STRATEGY_NAMES = ('astar', 'greedy', 'idastar', 'arastar', 'beam')
+HEURISTIC_NAMES = ('goalcount', 'advanced')
+ACTION_LIBRARY_NAMES = ('default', 'sticky')
+
+
+def parse_configurations(text):
+    """
+    Parses a comma separated list of configurations on the form strategy[:heuristic[:action library]],
+    e.g. 'bfs,greedy:advanced,astar:goalcount:sticky'. The default action library is used if none is given.
+    Raises a ValueError naming the configuration if any of the names is not recognized, or if a strategy which needs
+    a heuristic lacks one, such that a bad configuration is rejected before any search is started.
+    """
+    parsed_configurations = []
+    for configuration in text.split(','):
+        parts = configuration.strip().split(':')
+        strategy_name = parts[0]
+        heuristic_name = parts[1] if len(parts) > 1 and parts[1] != '' else None
+        action_library_name = parts[2] if len(parts) > 2 else 'default'
+        if len(parts) > 3:
+            raise ValueError(f"Portfolio configuration '{configuration}' has more than three parts")
+        if strategy_name not in STRATEGY_NAMES:
+            raise ValueError(f"Portfolio configuration '{configuration}' has an unrecognized strategy "
+                             f"'{strategy_name}', expected one of {', '.join(STRATEGY_NAMES)}")
+        if heuristic_name is None and strategy_name in HEURISTIC_STRATEGY_NAMES:
+            raise ValueError(f"Portfolio configuration '{configuration}' needs a heuristic for '{strategy_name}', "
+                             f"expected one of {', '.join(HEURISTIC_NAMES)}")
+        if heuristic_name is not None and heuristic_name not in HEURISTIC_NAMES:
+            raise ValueError(f"Portfolio configuration '{configuration}' has an unrecognized heuristic "
+                             f"'{heuristic_name}', expected one of {', '.join(HEURISTIC_NAMES)}")
+        if action_library_name not in ACTION_LIBRARY_NAMES:
+            raise ValueError(f"Portfolio configuration '{configuration}' has an unrecognized action library "
+                             f"'{action_library_name}', expected one of {', '.join(ACTION_LIBRARY_NAMES)}")
+        parsed_configurations.append((strategy_name, heuristic_name, action_library_name))
+    return parsed_configurations
+
+
+def portfolio_agent_type(level, initial_state, goal_description, portfolio):
+    """
+    Races a portfolio of search configurations, given as a list of (name, action library, frontier) triplets, in
+    separate processes, each with an equal share of the maximum memory usage. The first plan found is executed like
+    in the classic agent type and the remaining searches are cancelled. A search which raises an exception reports it
+    and counts as having found no plan.
+    """
+    # Check that every configuration could be constructed before any search is started
+    for (name, action_library, frontier) in portfolio:
+        if action_library is None or frontier is None:
+            print(f"Portfolio configuration '{name}' is invalid", file=sys.stderr, flush=True)
+            return
+
+    results = multiprocessing.Queue()
+    max_usage = memory.max_usage / len(portfolio)
+    workers = []
+    for (index, (name, action_library, frontier)) in enumerate(portfolio):
+        action_set = [action_library] * level.num_agents
+        worker = multiprocessing.Process(target=portfolio_worker,
+                                         args=(index, initial_state, action_set, goal_description, frontier, results,
+                                               max_usage))
+        worker.start()
+        workers.append(worker)
+
+    # Wait for the first plan. A search which fails or runs out of memory ends without a plan.
+    plan = None
+    num_finished = 0
+    while plan is None and num_finished < len(portfolio):
+        try:
+            index, success, joint_action_ids, error = results.get(timeout=0.1)
+        except queue.Empty:
+            # A search exceeding its memory share exits without reporting, which is only noticed once it has stopped
+            if not any(worker.is_alive() for worker in workers) and results.empty():
+                break
+            continue
+        num_finished += 1
+        name, action_library, _ = portfolio[index]
+        if error is not None:
+            print(f"Portfolio configuration '{name}' failed:\n{error}", file=sys.stderr, flush=True)
+        elif success:
+            joint_action_encoder = JointActionEncoder([action_library] * level.num_agents)
+            plan = [joint_action_encoder.decode(joint_action_id) for joint_action_id in joint_action_ids]
+            print(f"Portfolio configuration '{name}' found the first plan", file=sys.stderr, flush=True)
+        else:
+            print(f"Portfolio configuration '{name}' found no plan", file=sys.stderr, flush=True)
+
+    for worker in workers:
+        worker.terminate()
+        worker.join()
+
+    if plan is None:
+        print("Unable to solve level.", file=sys.stderr)
+        return
+
+    print("Found solution of length %d" % len(plan), file=sys.stderr)
+
+    for joint_action in plan:
+        # Send the joint action to the server
+        print(joint_action_to_string(joint_action), flush=True)
+        # Uncomment the below line to print the executed actions to the command line for debugging purposes
+        # print(joint_action_to_string(joint_action), file=sys.stderr, flush=True)
+
+        # Read back whether the agents succeeded in performing the joint action
+        execution_successes = parse_response(read_line())
+        if False in execution_successes:
+            print("Execution failed! Stopping...", file=sys.stderr)
+            # One of the agents failed to execute their action.
+            # This should not occur in classical planning and we therefore just abort immediately
+            return
+
+
+def portfolio_worker(index, initial_state, action_set, goal_description, frontier, results, max_usage):
+    """
+    Runs a single search of the portfolio and reports the plan as joint action ids (see JointActionEncoder), or the
+    traceback of the exception raised by the search
+    """
+    memory.max_usage = max_usage
+    try:
+        success, plan = graph_search(initial_state, action_set, goal_description, frontier)
+        joint_action_encoder = JointActionEncoder(action_set)
+        results.put((index, success, [joint_action_encoder.encode(joint_action) for joint_action in plan], None))
+    except Exception:
+        results.put((index, False, [], traceback.format_exc()))
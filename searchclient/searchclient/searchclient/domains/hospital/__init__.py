@@ -15,6 +15,6 @@
 
 from domains.hospital.actions import DEFAULT_HOSPITAL_ACTION_LIBRARY, STICKY_HOSPITAL_ACTION_LIBRARY
 from domains.hospital.goal_description import HospitalGoalDescription
-from domains.hospital.heuristics import HospitalGoalCountHeuristics, HospitalAdvancedHeuristics
+from domains.hospital.heuristics import HospitalGoalCountHeuristics, HospitalAdvancedHeuristics, HeuristicCache
 from domains.hospital.level import HospitalLevel
 from domains.hospital.state import HospitalState
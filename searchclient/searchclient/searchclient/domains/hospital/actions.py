@@ -11,15 +11,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-# pos_add and pos_sub are helper methods for performing element-wise addition and subtractions on positions
-# Ex: Given two positions A = (1, 2) and B = (3, 4), pos_add(A, B) == (4, 6) and pos_sub(B, A) == (2,2)
-from utils import pos_add, pos_sub
-
-direction_deltas = {
-    'N': (-1, 0),
-    'S': (1, 0),
-    'E': (0, 1),
-    'W': (0, -1),
+# Actions work on the cell ids of the level (see level.py). The neighbour of a cell in a direction is looked up in the
+# precompiled neighbour tables of the level, e.g. level.neighbours['N'][cell], which is NO_CELL if it is a wall.
+from domains.hospital.level import DIRECTIONS
+
+direction_deltas = DIRECTIONS
+
+# The direction opposite to each direction, used to find the box behind an agent performing a Pull action
+opposite_directions = {
+    'N': 'S',
+    'S': 'N',
+    'E': 'W',
+    'W': 'E',
 }
 
 # An action class must implement three types be a valid action:
@@ -27,7 +30,8 @@ direction_deltas = {
 #    the agent with 'agent_index' to perform in 'state' independently of any other action performed by other agents.
 # 2) result(self, agent_index, state) which modifies the 'state' to incorporate the changes caused by the agent
 #    performing the action. Since we *always* call both 'is_applicable' and 'conflicts' prior to calling 'result',
-#    there is no need to check for correctness.
+#    there is no need to check for correctness. Objects are moved using 'state.move_agent' and 'state.move_box',
+#    since the positions are packed inside the state (see state.py).
 # 3) conflicts(self, agent_index, state) which returns information regarding potential conflicts with other actions
 #    performed concurrently by other agents. More specifically, conflicts can occur with regard to the following
 #    two invariants:
@@ -36,8 +40,8 @@ direction_deltas = {
 #    B) Two agents may not move the same box concurrently,
 #       Ex: '0A1' where agent 0 performs Pull(W,W) and agent 1 performs Pull(E,E)
 #    In order to check for these, the conflict method should return two lists:
-#       a) destinations which contains all newly occupied cells.
-#       b) moved_boxes which contains the current position of boxes moved during the action, i.e. their position
+#       a) destinations which contains the cell ids of all newly occupied cells.
+#       b) moved_boxes which contains the current cell ids of boxes moved during the action, i.e. their cells
 #          prior to being moved by the action.
 # Note that 'agent_index' is the index of the agent in the state.agent_positions list which is often but *not always*
 # the same as the numerical value of the agent character.
@@ -50,42 +54,46 @@ class NoOpAction:
 
     def is_applicable(self, agent_index,  state):
         # Optimization. NoOp can never change the state if we only have a single agent
-        return len(state.agent_positions) > 1
+        return len(state.agent_chars) > 1
 
     def result(self, agent_index, state):
         pass
 
     def conflicts(self, agent_index, state):
-        current_agent_position, _ = state.agent_positions[agent_index]
-        destinations = [current_agent_position]
+        current_agent_cell = state.agent_cell(agent_index)
+        destinations = [current_agent_cell]
         boxes_moved = []
         return destinations, boxes_moved
 
 
 class MoveAction:
 
+    # Sticky actions are not applicable if the agent, or the box it moves, is placed on one of its own goals
+    sticky = False
+
     def __init__(self, agent_direction):
+        self.agent_direction = agent_direction
         self.agent_delta = direction_deltas.get(agent_direction)
         self.name = "Move(%s)" % agent_direction
 
-    def calculate_positions(self, current_agent_position):
-        return pos_add(current_agent_position, self.agent_delta)
+    def calculate_positions(self, level, current_agent_cell):
+        return level.neighbours[self.agent_direction][current_agent_cell]
 
     def is_applicable(self, agent_index, state):
-        current_agent_position, _ = state.agent_positions[agent_index]
-        new_agent_position = self.calculate_positions(current_agent_position)
-        return state.free_at(new_agent_position)
+        current_agent_cell = state.agent_cell(agent_index)
+        new_agent_cell = self.calculate_positions(state.level, current_agent_cell)
+        return state.free_at_cell(new_agent_cell)
 
     def result(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        new_agent_position = self.calculate_positions(current_agent_position)
-        state.agent_positions[agent_index] = (new_agent_position, agent_char)
+        current_agent_cell = state.agent_cell(agent_index)
+        new_agent_cell = self.calculate_positions(state.level, current_agent_cell)
+        state.move_agent(agent_index, new_agent_cell)
 
     def conflicts(self, agent_index, state):
-        current_agent_position, _ = state.agent_positions[agent_index]
-        new_agent_position = self.calculate_positions(current_agent_position)
+        current_agent_cell = state.agent_cell(agent_index)
+        new_agent_cell = self.calculate_positions(state.level, current_agent_cell)
         # New agent position is a destination because it is unoccupied before the action and occupied after the action.
-        destinations = [new_agent_position]
+        destinations = [new_agent_cell]
         # Since a Move action never moves a box, we can just return the empty value.
         boxes_moved = []
         return destinations, boxes_moved
@@ -93,24 +101,29 @@ class MoveAction:
 
 ## Herunder forsøges indsættelse af push action
 class PushAction:
+    sticky = False
+
     def __init__(self, agent_direction, box_direction):
+        self.agent_direction = agent_direction
+        self.box_direction = box_direction
         self.agent_delta = direction_deltas.get(agent_direction)
         self.box_delta = direction_deltas.get(box_direction)
         self.name = "Push(%s,%s)" % (agent_direction, box_direction)
 
-    def calculate_agent_positions(self, current_agent_position):
-        return pos_add(current_agent_position, self.agent_delta)
+    def calculate_agent_positions(self, level, current_agent_cell):
+        return level.neighbours[self.agent_direction][current_agent_cell]
     
     # function for box position
-    def calculate_box_positions(self, current_box_position):
-        return pos_add(current_box_position, self.box_delta)
+    def calculate_box_positions(self, level, current_box_cell):
+        return level.neighbours[self.box_direction][current_box_cell]
 
     def is_applicable(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
+        current_agent_cell = state.agent_cell(agent_index)
+        agent_char = state.agent_chars[agent_index]
         # calculate box position based on position and direction of agent
-        current_box_position = self.calculate_agent_positions(current_agent_position)
+        current_box_cell = self.calculate_agent_positions(state.level, current_agent_cell)
 
-        box_index, box_char = state.box_at(current_box_position)
+        box_index, box_char = state.box_at_cell(current_box_cell)
 
         # Check if box is present at location
         if box_index == -1:
@@ -120,60 +133,64 @@ class PushAction:
             return False
         
         # Calculate new box position
-        new_box_position = self.calculate_box_positions(current_box_position)
+        new_box_cell = self.calculate_box_positions(state.level, current_box_cell)
 
         # returns true if new box position is free
-        return state.free_at(new_box_position) 
+        return state.free_at_cell(new_box_cell)
 
     def result(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
+        current_agent_cell = state.agent_cell(agent_index)
         # calculate box position based on position and direction of agent
-        current_box_position = self.calculate_agent_positions(current_agent_position)
+        current_box_cell = self.calculate_agent_positions(state.level, current_agent_cell)
         
         # save which box will be moved
-        box_index, box_char = state.box_at(current_box_position)
+        box_index, box_char = state.box_at_cell(current_box_cell)
 
         # find new position of box and agent, after Push
-        new_box_position = self.calculate_box_positions(current_box_position)
-        new_agent_position = self.calculate_agent_positions(current_agent_position)
+        new_box_cell = self.calculate_box_positions(state.level, current_box_cell)
+        new_agent_cell = current_box_cell
 
         # update agent and box positions 
-        state.agent_positions[agent_index] = (new_agent_position, agent_char)
-        state.box_positions[box_index] = (new_box_position, box_char)
+        state.move_agent(agent_index, new_agent_cell)
+        state.move_box(box_index, new_box_cell)
 
 
     def conflicts(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        current_box_position = self.calculate_agent_positions(current_agent_position)
-        new_agent_position = current_box_position
-        new_box_position = self.calculate_box_positions(current_box_position)
+        current_agent_cell = state.agent_cell(agent_index)
+        current_box_cell = self.calculate_agent_positions(state.level, current_agent_cell)
+        new_box_cell = self.calculate_box_positions(state.level, current_box_cell)
         
         # New agent position is a destination because it is unoccupied before the action and occupied after the action.
-        destinations = [new_box_position]
+        destinations = [new_box_cell]
         # Since a Move action never moves a box, we can just return the empty value.
-        boxes_moved = [current_box_position]
+        boxes_moved = [current_box_cell]
         return destinations, boxes_moved
 
 ## Herunder forsøges indsættelse af pull action
 class PullAction:
+    sticky = False
+
     def __init__(self, agent_direction, box_direction):
+        self.agent_direction = agent_direction
+        self.box_direction = box_direction
         self.agent_delta = direction_deltas.get(agent_direction)
         self.box_delta = direction_deltas.get(box_direction)
         self.name = "Pull(%s,%s)" % (agent_direction, box_direction)
 
-    def calculate_agent_positions(self, current_agent_position):
-        return pos_add(current_agent_position, self.agent_delta)
+    def calculate_agent_positions(self, level, current_agent_cell):
+        return level.neighbours[self.agent_direction][current_agent_cell]
     
-    # function for box position
-    def calculate_box_positions(self, current_box_position):
-        return pos_add(current_box_position, self.box_delta)
+    # function for box position, i.e. the cell behind the agent seen from the direction the box moves in
+    def calculate_box_positions(self, level, current_agent_cell):
+        return level.neighbours[opposite_directions[self.box_direction]][current_agent_cell]
 
     def is_applicable(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
+        current_agent_cell = state.agent_cell(agent_index)
+        agent_char = state.agent_chars[agent_index]
         # calculate box position based on position of agent and direction of box
-        current_box_position = pos_sub(current_agent_position, self.box_delta)
+        current_box_cell = self.calculate_box_positions(state.level, current_agent_cell)
 
-        box_index, box_char = state.box_at(current_box_position)
+        box_index, box_char = state.box_at_cell(current_box_cell)
 
         # Check if box is present at location
         if box_index == -1:
@@ -183,39 +200,38 @@ class PullAction:
             return False
         
         # Calculate new agent position
-        new_agent_position = self.calculate_agent_positions(current_agent_position)
+        new_agent_cell = self.calculate_agent_positions(state.level, current_agent_cell)
         
         # returns true if new agent position is free
-        return state.free_at(new_agent_position) 
+        return state.free_at_cell(new_agent_cell)
 
     def result(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
+        current_agent_cell = state.agent_cell(agent_index)
         # calculate current box position based on position of agent, and direction of box
-        current_box_position = pos_sub(current_agent_position, self.box_delta)
+        current_box_cell = self.calculate_box_positions(state.level, current_agent_cell)
         
         # save which box will be moved
-        box_index, box_char = state.box_at(current_box_position)
+        box_index, box_char = state.box_at_cell(current_box_cell)
 
         # find new position of box and agent, after Push
-        new_box_position = current_agent_position
-        new_agent_position = self.calculate_agent_positions(current_agent_position)
+        new_box_cell = current_agent_cell
+        new_agent_cell = self.calculate_agent_positions(state.level, current_agent_cell)
     
         # update agent and box positions 
-        state.agent_positions[agent_index] = (new_agent_position, agent_char)
-        state.box_positions[box_index] = (new_box_position, box_char)
+        state.move_agent(agent_index, new_agent_cell)
+        state.move_box(box_index, new_box_cell)
 
 
     def conflicts(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        current_box_position = pos_sub(current_agent_position, self.box_delta)
+        current_agent_cell = state.agent_cell(agent_index)
+        current_box_cell = self.calculate_box_positions(state.level, current_agent_cell)
         
-        new_agent_position = self.calculate_agent_positions(current_agent_position)
-        new_box_position = current_agent_position
+        new_agent_cell = self.calculate_agent_positions(state.level, current_agent_cell)
         
         # New agent position is a destination because it is unoccupied before the action and occupied after the action.
-        destinations = [new_agent_position]
+        destinations = [new_agent_cell]
         # Since a Move action never moves a box, we can just return the empty value.
-        boxes_moved = [current_box_position]
+        boxes_moved = [current_box_cell]
         return destinations, boxes_moved
 
 
@@ -223,60 +239,31 @@ class PullAction:
 
 # ******
 
-class StickyMoveAction:
-
-    def __init__(self, agent_direction):
-        self.agent_delta = direction_deltas.get(agent_direction)
-        self.name = "Move(%s)" % agent_direction
-
-    def calculate_positions(self, current_agent_position):
-        return pos_add(current_agent_position, self.agent_delta)
+class StickyMoveAction(MoveAction):
+    sticky = True
 
 # incorporate preconditions Exercise 1.1
     def is_applicable(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        new_agent_position = self.calculate_positions(current_agent_position)
+        current_agent_cell = state.agent_cell(agent_index)
+        agent_char = state.agent_chars[agent_index]
+        new_agent_cell = self.calculate_positions(state.level, current_agent_cell)
 
-        all_goals = state.level.agent_goal_at(current_agent_position) == agent_char
+        all_goals = state.level.agent_goal_cells.get(current_agent_cell) == agent_char
        
-        return state.free_at(new_agent_position) and  not all_goals 
-
-    def result(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        new_agent_position = self.calculate_positions(current_agent_position)
-        state.agent_positions[agent_index] = (new_agent_position, agent_char)
-
-    def conflicts(self, agent_index, state):
-        current_agent_position, _ = state.agent_positions[agent_index]
-        new_agent_position = self.calculate_positions(current_agent_position)
-        # New agent position is a destination because it is unoccupied before the 
-        # action and occupied after the action.
-        destinations = [new_agent_position]
-        # Since a Move action never moves a box, we can just return the empty value.
-        boxes_moved = []
-        return destinations, boxes_moved
+        return state.free_at_cell(new_agent_cell) and  not all_goals 
 
 
 ## Herunder indsættes sticky push action
-class StickyPushAction:
-    def __init__(self, agent_direction, box_direction):
-        self.agent_delta = direction_deltas.get(agent_direction)
-        self.box_delta = direction_deltas.get(box_direction)
-        self.name = "Push(%s,%s)" % (agent_direction, box_direction)
-
-    def calculate_agent_positions(self, current_agent_position):
-        return pos_add(current_agent_position, self.agent_delta)
-    
-    # function for box position
-    def calculate_box_positions(self, current_box_position):
-        return pos_add(current_box_position, self.box_delta)
+class StickyPushAction(PushAction):
+    sticky = True
 
     def is_applicable(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
+        current_agent_cell = state.agent_cell(agent_index)
+        agent_char = state.agent_chars[agent_index]
         # calculate box position based on position and direction of agent
-        current_box_position = self.calculate_agent_positions(current_agent_position)
+        current_box_cell = self.calculate_agent_positions(state.level, current_agent_cell)
 
-        box_index, box_char = state.box_at(current_box_position)
+        box_index, box_char = state.box_at_cell(current_box_cell)
 
         # Check if box is present at location
         if box_index == -1:
@@ -286,64 +273,39 @@ class StickyPushAction:
             return False
         
         # Calculate new box position
-        new_box_position = self.calculate_box_positions(current_box_position)
+        new_box_cell = self.calculate_box_positions(state.level, current_box_cell)
        
         # New for exercise 1.1 Mavis2
-        all_goals_box = state.level.box_goal_at(current_box_position) == box_char
-        all_goals_agent = state.level.agent_goal_at(current_agent_position) == agent_char
+        all_goals_box = state.level.box_goal_cells.get(current_box_cell) == box_char
+        all_goals_agent = state.level.agent_goal_cells.get(current_agent_cell) == agent_char
 
         # returns true if new box position is free
-        return state.free_at(new_box_position) and not all_goals_agent and not all_goals_box 
-
-    def result(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        # calculate box position based on position and direction of agent
-        current_box_position = self.calculate_agent_positions(current_agent_position)
-        
-        # save which box will be moved
-        box_index, box_char = state.box_at(current_box_position)
-
-        # find new position of box and agent, after Push
-        new_box_position = self.calculate_box_positions(current_box_position)
-        new_agent_position = self.calculate_agent_positions(current_agent_position)
-
-        # update agent and box positions 
-        state.agent_positions[agent_index] = (new_agent_position, agent_char)
-        state.box_positions[box_index] = (new_box_position, box_char)
+        return state.free_at_cell(new_box_cell) and not all_goals_agent and not all_goals_box 
 
     def conflicts(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        current_box_position = self.calculate_agent_positions(current_agent_position)
-        new_agent_position = current_box_position
-        new_box_position = self.calculate_box_positions(current_box_position)
+        current_agent_cell = state.agent_cell(agent_index)
+        current_box_cell = self.calculate_agent_positions(state.level, current_agent_cell)
+        new_agent_cell = current_box_cell
+        new_box_cell = self.calculate_box_positions(state.level, current_box_cell)
         
         # New agent position is a destination because it is unoccupied before the action 
         # and occupied after the action.
-        destinations = [new_agent_position, new_box_position]
+        destinations = [new_agent_cell, new_box_cell]
         # Since a Move action never moves a box, we can just return the empty value.
-        boxes_moved = [current_box_position]
+        boxes_moved = [current_box_cell]
         return destinations, boxes_moved
 
 ## Herunder indsættes pull action
-class StickyPullAction:
-    def __init__(self, agent_direction, box_direction):
-        self.agent_delta = direction_deltas.get(agent_direction)
-        self.box_delta = direction_deltas.get(box_direction)
-        self.name = "Pull(%s,%s)" % (agent_direction, box_direction)
-
-    def calculate_agent_positions(self, current_agent_position):
-        return pos_add(current_agent_position, self.agent_delta)
-    
-    # function for box position
-    def calculate_box_positions(self, current_box_position):
-        return pos_add(current_box_position, self.box_delta)
+class StickyPullAction(PullAction):
+    sticky = True
 
     def is_applicable(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
+        current_agent_cell = state.agent_cell(agent_index)
+        agent_char = state.agent_chars[agent_index]
         # calculate box position based on position of agent and direction of box
-        current_box_position = pos_sub(current_agent_position, self.box_delta)
+        current_box_cell = self.calculate_box_positions(state.level, current_agent_cell)
 
-        box_index, box_char = state.box_at(current_box_position)
+        box_index, box_char = state.box_at_cell(current_box_cell)
 
         # Check if box is present at location
         if box_index == -1:
@@ -353,44 +315,27 @@ class StickyPullAction:
             return False
         
         # Calculate new agent position
-        new_agent_position = self.calculate_agent_positions(current_agent_position)
+        new_agent_cell = self.calculate_agent_positions(state.level, current_agent_cell)
         
         # New for exercise 1.1 Mavis2
-        all_goals_box = state.level.box_goal_at(current_box_position) == box_char
-        all_goals_agent = state.level.agent_goal_at(current_agent_position) == agent_char
+        all_goals_box = state.level.box_goal_cells.get(current_box_cell) == box_char
+        all_goals_agent = state.level.agent_goal_cells.get(current_agent_cell) == agent_char
 
         # returns true if new agent position is free and....
-        return state.free_at(new_agent_position) and not all_goals_agent and not all_goals_box 
-
-    def result(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        # calculate current box position based on position of agent, and direction of box
-        current_box_position = pos_sub(current_agent_position, self.box_delta)
-        
-        # save which box will be moved
-        box_index, box_char = state.box_at(current_box_position)
-
-        # find new position of box and agent, after Push
-        new_box_position = current_agent_position
-        new_agent_position = self.calculate_agent_positions(current_agent_position)
-    
-        # update agent and box positions 
-        state.agent_positions[agent_index] = (new_agent_position, agent_char)
-        state.box_positions[box_index] = (new_box_position, box_char)
-
+        return state.free_at_cell(new_agent_cell) and not all_goals_agent and not all_goals_box 
 
     def conflicts(self, agent_index, state):
-        current_agent_position, agent_char = state.agent_positions[agent_index]
-        current_box_position = pos_sub(current_agent_position, self.box_delta)
+        current_agent_cell = state.agent_cell(agent_index)
+        current_box_cell = self.calculate_box_positions(state.level, current_agent_cell)
         
-        new_agent_position = self.calculate_agent_positions(current_agent_position)
-        new_box_position = current_agent_position
+        new_agent_cell = self.calculate_agent_positions(state.level, current_agent_cell)
+        new_box_cell = current_agent_cell
         
         # New agent position is a destination because it is unoccupied before the action 
         # and occupied after the action.
-        destinations = [new_agent_position, new_box_position]
+        destinations = [new_agent_cell, new_box_cell]
         # Since a Move action never moves a box, we can just return the empty value.
-        boxes_moved = [current_box_position]
+        boxes_moved = [current_box_cell]
         return destinations, boxes_moved
 
 
@@ -505,3 +450,43 @@ STICKY_HOSPITAL_ACTION_LIBRARY = [
 
 
 ]
+
+
+def reverse_action(action):
+    """
+    Returns the action which undoes the given action, or None if there is no such action.
+    The reverse action is applicable in a state exactly when the given action leads to that state from the state the
+    reverse action leads to, i.e. Push(d1,d2) is undone by Pull(opposite d1,opposite d2) and vice versa.
+    This allows searching backwards from a goal state using the forward semantics of the reverse actions.
+    Sticky actions depend on the state they are applied in, which the reverse action does not see, so they and the
+    actions of unknown types have no reverse action.
+    """
+    if isinstance(action, NoOpAction):
+        return action
+    if type(action) is MoveAction:
+        return MoveAction(opposite_directions[action.agent_direction])
+    if type(action) is PushAction:
+        return PullAction(opposite_directions[action.agent_direction], opposite_directions[action.box_direction])
+    if type(action) is PullAction:
+        return PushAction(opposite_directions[action.agent_direction], opposite_directions[action.box_direction])
+    return None
+
+
+# The reversed action libraries are cached by the identity of the action library, just like the compiled action
+# libraries (see successors.py), such that all searches share the same reversed library.
+_reversed_action_libraries = {}
+
+
+def reverse_action_library(actions):
+    """
+    Returns a list holding the reverse action of every action in the library, in the same order,
+    or None if any of the actions has no reverse action.
+    """
+    entry = _reversed_action_libraries.get(id(actions))
+    if entry is None:
+        reversed_actions = [reverse_action(action) for action in actions]
+        if None in reversed_actions:
+            reversed_actions = None
+        entry = (actions, reversed_actions)
+        _reversed_action_libraries[id(actions)] = entry
+    return entry[1]
@@ -11,6 +11,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import itertools
+from domains.hospital.state import HospitalState
+
+
 class HospitalGoalDescription:
 
     """
@@ -20,11 +24,15 @@ class HospitalGoalDescription:
     negative goal is satisfied when such an object is *not* at the goal position.
     The 'goal' member contains all goals (both agent and box goals) while 'agent_goal' and 'box_goal' only
     contains one kind. This double representation allows for quick and convenient lookup of goals of a specific kind
+    The 'goal_cells' member contains the same literals as 'goals', but with the cell id of the goal position instead
+    of the position itself (see level.py).
     """
 
     def __init__(self, level, goals):
         self.level = level
         self.goals = goals
+        self.goal_cells = [(level.cell_of(goal_position), goal_char, is_positive_literal)
+                           for (goal_position, goal_char, is_positive_literal) in goals]
         self.agent_goals = []
         self.box_goals = []
         for goal in self.goals:
@@ -35,8 +43,8 @@ class HospitalGoalDescription:
 
     def is_goal(self, state):
         """Returns whether the given state satisfies all goals in the goal description"""
-        for (goal_position, goal_char, is_positive_literal) in self.goals:
-            char = state.object_at(goal_position)
+        for (goal_cell, goal_char, is_positive_literal) in self.goal_cells:
+            char = state.object_at_cell(goal_cell)
             if is_positive_literal and goal_char != char:
                 return False
             elif not is_positive_literal and goal_char == char:
@@ -44,6 +52,37 @@ class HospitalGoalDescription:
 
         return True
 
+    def goal_states(self, state):
+        """
+        Returns all states with the objects of the given state which satisfy the goal description, or None if the
+        goal description does not place every box, e.g. because a box has no goal or a goal is negative.
+        An agent without a goal may be in any free cell which is not the goal of a box, so one state is returned for
+        every combination of such cells. Since boxes with the same character are indistinguishable, there is only a
+        single way to place the boxes, even if several goals share a character.
+        """
+        if not all(is_positive_literal for (_, _, is_positive_literal) in self.goals):
+            return None
+        if sorted(goal_char for (_, goal_char, _) in self.box_goals) != sorted(state.box_chars):
+            return None
+        agent_goal_positions = {goal_char: goal_position for (goal_position, goal_char, _) in self.agent_goals}
+        if len(agent_goal_positions) != len(self.agent_goals) or \
+                not set(agent_goal_positions).issubset(state.agent_chars):
+            return None
+
+        box_positions = [(goal_position, goal_char) for (goal_position, goal_char, _) in self.box_goals]
+        occupied_positions = {goal_position for (goal_position, _) in box_positions}
+        occupied_positions.update(agent_goal_positions.values())
+        free_positions = [position for position in self.level.cell_positions if position not in occupied_positions]
+
+        goal_states = []
+        agents_without_goal = [agent_char for agent_char in state.agent_chars if agent_char not in agent_goal_positions]
+        for positions in itertools.permutations(free_positions, len(agents_without_goal)):
+            agent_free_positions = dict(zip(agents_without_goal, positions))
+            agent_positions = [(agent_goal_positions.get(agent_char) or agent_free_positions[agent_char], agent_char)
+                               for agent_char in state.agent_chars]
+            goal_states.append(HospitalState(self.level, agent_positions, box_positions))
+        return goal_states
+
     def color_filter(self, color):
         """Creates a copy of the goal descriptions where all entities of another color has been removed"""
         filtered_goals = []
@@ -53,6 +92,11 @@ class HospitalGoalDescription:
 
         return HospitalGoalDescription(self.level, filtered_goals)
 
+    def colors_filter(self, colors):
+        """Creates a copy of the goal descriptions where all entities of other colors than the given ones are removed"""
+        filtered_goals = [goal for goal in self.goals if self.level.colors[goal[1]] in colors]
+        return HospitalGoalDescription(self.level, filtered_goals)
+
     def get_sub_goal(self, index):
         """
         This function allow each sub goal to be considered one at a time.
@@ -11,11 +11,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from numpy import linalg as LA
+import numpy as np
 import sys
 import itertools
 from utils import pos_add, pos_sub, APPROX_INFINITY
+from domains.hospital.state import unpack_cells, CELL_TYPECODE
 import math
+from collections import OrderedDict
+
+# Batches with fewer goal distances to compute than this are computed without NumPy, whose overhead per call outweighs
+# the speedup for the few children of a single-agent expansion
+MIN_VECTORISED_DISTANCES = 48
+# The default maximum number of heuristic values kept by a HeuristicCache, where 0 disables the cache.
+# The searchclient sets this from the command line.
+default_cache_size = 0
 
 class HospitalGoalCountHeuristics:
 
@@ -29,50 +38,171 @@ class HospitalGoalCountHeuristics:
 
     def h(self, state, goal_description):
         # Your code goes here...
-        n_goals = goal_description.num_sub_goals()
+        n_goals = 0
 
-        for index in range(goal_description.num_sub_goals()):
-            sub_goal = goal_description.get_sub_goal(index)
-            n_goals -= sub_goal.is_goal(state)
+        # A goal is unsatisfied if the object at the goal cell matches the goal character for a negative goal,
+        # or does not match it for a positive goal
+        for (goal_cell, goal_char, is_positive_literal) in goal_description.goal_cells:
+            if (state.object_at_cell(goal_cell) == goal_char) != is_positive_literal:
+                n_goals += 1
 
         return n_goals
 
+    def h_batch(self, states, goal_description):
+        # Returns the heuristic values of all the states, such as the children of an expansion
+        return [self.h(state, goal_description) for state in states]
+
+    def resolution(self, goal_description):
+        # The heuristic values are multiplied by this to get integers, e.g. for the buckets of a BucketPriorityQueue
+        return 1
+
 
 class HospitalAdvancedHeuristics:
 
     def __init__(self):
-        pass
+        # The goal description and the box characters which the matching below was computed for
+        self.goal_description = None
+        self.box_chars = None
+        # The box goals as arrays of goal rows and goal columns, and the index of the box matched to each of them
+        self.goal_rows = None
+        self.goal_cols = None
+        self.box_indices = None
+        # The same matching as a list of (box index, goal row, goal column), for states which are not vectorised
+        self.matching = None
+        self.num_goals = 0
+        # The rows and columns of all cells, indexed by cell id
+        self.cell_rows = None
+        self.cell_cols = None
 
     def preprocess(self, level):
         # This function will be called a single time prior to the search allowing us to preprocess the level such as
         # pre-computing lookup tables or other acceleration structures
-        
-        
-        pass
-
+        self.cell_rows = np.array([row for (row, _) in level.cell_positions], dtype=np.int32)
+        self.cell_cols = np.array([col for (_, col) in level.cell_positions], dtype=np.int32)
+
+    def match_boxes(self, state, goal_description):
+        # Every box goal is matched to the first box with the same character which has not been matched to an earlier
+        # goal. The characters of the boxes never change and the boxes are ordered by character, so the matching only
+        # depends on the indices of the boxes, and it is computed once per goal description and box characters.
+        if goal_description is self.goal_description and state.box_chars == self.box_chars:
+            return
+        if self.cell_rows is None:
+            self.preprocess(state.level)
+        used_boxes = set()
+        goal_cells = []
+        box_indices = []
+        for (goal_cell, goal_char, _) in goal_description.goal_cells:
+            if not 'A' <= goal_char <= 'Z':
+                continue
+            for box_idx, box_char in enumerate(state.box_chars):
+                # continue if box is a match and has not already been allocated to a specific goal
+                if goal_char == box_char and (box_idx not in used_boxes):
+                    used_boxes.add(box_idx)
+                    goal_cells.append(goal_cell)
+                    box_indices.append(box_idx)
+                    break
+        self.goal_rows = self.cell_rows[goal_cells]
+        self.goal_cols = self.cell_cols[goal_cells]
+        self.box_indices = np.array(box_indices, dtype=np.intp)
+        self.matching = list(zip(box_indices, self.goal_rows.tolist(), self.goal_cols.tolist()))
+        # The distances are averaged over all box goals, including those without a matching box
+        self.num_goals = sum(1 for (_, goal_char, _) in goal_description.goal_cells if 'A' <= goal_char <= 'Z')
+        self.goal_description = goal_description
+        self.box_chars = state.box_chars
+
+    def cache_key(self, state):
+        # The heuristic value only depends on the boxes, so it can be shared by all states with the same box
+        # configuration (see HeuristicCache). The boxes are ordered by character and then by cell, so equal box
+        # configurations have equal keys.
+        return state.box_chars, state.box_cells
+
+    def resolution(self, goal_description):
+        # The heuristic values are averages over the box goals, so multiplying them by the number of box goals gives
+        # the integral sums of the distances
+        return max(1, sum(1 for (_, goal_char, _) in goal_description.goal_cells if 'A' <= goal_char <= 'Z'))
 
     def h(self, state, goal_description):
+        return self.h_batch([state], goal_description)[0]
+
+    def h_batch(self, states, goal_description):
+        # Returns the heuristic values of all the states, such as the children of an expansion. The cells of the boxes
+        # of the states are stacked into a single array with a row per state, such that the manhattan distances
+        # between all goals and their matched boxes are computed at once.
+        if len(states) == 0:
+            return []
+        self.match_boxes(states[0], goal_description)
+        if self.num_goals == 0:
+            return [0] * len(states)
+        if len(states) * len(self.matching) < MIN_VECTORISED_DISTANCES:
+            cell_positions = states[0].level.cell_positions
+            h_values = []
+            for state in states:
+                box_cells = unpack_cells(state.box_cells)
+                dist = 0
+                for (box_idx, goal_row, goal_col) in self.matching:
+                    box_row, box_col = cell_positions[box_cells[box_idx]]
+                    dist += abs(goal_row-box_row)+abs(goal_col-box_col)
+                h_values.append(dist / self.num_goals)
+            return h_values
+        box_cells = np.frombuffer(b''.join([state.box_cells for state in states]), dtype=CELL_TYPECODE)
+        matched_cells = box_cells.reshape(len(states), -1)[:, self.box_indices]
+        dist = np.abs(self.cell_rows[matched_cells] - self.goal_rows) + \
+               np.abs(self.cell_cols[matched_cells] - self.goal_cols)
 
-        # # Get name and position of box and goals
-        goals = goal_description.box_goals
-        boxes = state.box_positions
-        # boxes which have been allocated to a goal
-        used_boxes = []
+        # Return average distance
+        return (dist.sum(axis=1) / self.num_goals).tolist()
 
-        # sum of distances between goals and boxes
-        dist = 0
 
+class HeuristicCache:
+    """
+    Memoises the values of a heuristic which only depends on part of a state. Heuristics opt into the cache by
+    providing cache_key(state), which returns a key identifying the part of the state the value depends on, such as
+    the box configuration. The cache keeps at most size values and evicts the least recently used value when it is
+    full. The cache is cleared whenever the goal description changes, and the hits and misses are counted until then.
+    """
 
-        # we iterate over goals, as each goal only needs one box, and the number of goals always is less or equal to the number of boxes
-        for goal in goals:
-            for box_idx, box in enumerate(boxes):
-                # continue if box is a match and has not already been allocated to a specific goal
-                if (goal[1] == box[1] and (box_idx not in used_boxes)):     
-                    # Calculate manhattan distance between these points and add to total distance   
-                    used_boxes.append(box_idx)          
-                    dist += abs(goal[0][0]-box[0][0])+abs(goal[0][1]-box[0][1])
-                    break
-        
-        # Return average distance
-        return dist/len(goals) 
+    def __init__(self, heuristic, size=None):
+        self.heuristic = heuristic
+        self.size = default_cache_size if size is None else size
+        self.goal_description = None
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def preprocess(self, level):
+        self.heuristic.preprocess(level)
+
+    def prepare(self, goal_description):
+        if goal_description is not self.goal_description:
+            self.goal_description = goal_description
+            self.values.clear()
+            self.hits = 0
+            self.misses = 0
 
+    def resolution(self, goal_description):
+        return self.heuristic.resolution(goal_description)
+
+    def h(self, state, goal_description):
+        return self.h_batch([state], goal_description)[0]
+
+    def h_batch(self, states, goal_description):
+        self.prepare(goal_description)
+        values = self.values
+        keys = [self.heuristic.cache_key(state) for state in states]
+        h_values = [values.get(key) for key in keys]
+        # The states whose values are not cached are evaluated in a single batch
+        missed_indices = [index for (index, h) in enumerate(h_values) if h is None]
+        self.misses += len(missed_indices)
+        self.hits += len(states) - len(missed_indices)
+        for (key, h) in zip(keys, h_values):
+            if h is not None:
+                values.move_to_end(key)
+
+        if len(missed_indices) > 0:
+            missed_h_values = self.heuristic.h_batch([states[index] for index in missed_indices], goal_description)
+            for (index, h) in zip(missed_indices, missed_h_values):
+                h_values[index] = h
+                values[keys[index]] = h
+            while len(values) > self.size:
+                values.popitem(last=False)
+        return h_values
@@ -11,8 +11,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import random
 import sys
 
+# Number of random bits in a Zobrist key. Keys below 2^61 - 1 are returned unchanged by Python's hash function.
+ZOBRIST_BITS = 60
+
+# The cell id used for positions which are not free cells, i.e. walls
+NO_CELL = -1
+
+DIRECTIONS = {
+    'N': (-1, 0),
+    'S': (1, 0),
+    'E': (0, 1),
+    'W': (0, -1),
+}
+
 
 class HospitalLevel:
     """
@@ -25,6 +40,18 @@ class HospitalLevel:
       See goal_description.py for further detail
     - initial_agent_positions and initial_box_positions are lists of the initial positions of agents and boxes in
       the format (position, character).
+    - The geometry of the level is precompiled at parse time into flat tables indexed by integers:
+      - wall_bitmap stores the walls row-major, i.e. wall_bitmap[row * num_cols + col] is 1 iff there is a wall.
+      - Every free cell, i.e. every position without a wall, is numbered by a cell id, which is the compact format
+        used by the states. cell_of and position_of convert between positions and cell ids, and cell_of returns
+        NO_CELL for walls.
+      - neighbours maps each direction 'N', 'S', 'E' and 'W' into a list holding the cell id of the neighbour of
+        every cell in that direction, or NO_CELL if the neighbour is a wall.
+      - agent_goal_cells and box_goal_cells map the cell ids of the goals into the goal characters.
+      This allows actions and heuristics to work on cell ids without computing any positions.
+    - zobrist is a map from characters into a list of random keys, one per cell. The hash value of a state is the
+      XOR of the keys of all its objects, i.e. zobrist[char][cell] for every object, which allows a state to update
+      its hash value in constant time when an object is moved.
     """
 
     def __init__(self, name, walls, colors, agent_goals, box_goals, initial_agent_positions, initial_box_positions):
@@ -43,6 +70,41 @@ class HospitalLevel:
         self.num_agent_goals = len(self.agent_goals)
         self.num_box_goals = len(self.box_goals)
 
+        # Precompile the geometry of the level. The positions of the cells are only created once here, such that
+        # converting a cell id into a position never allocates.
+        self.num_rows = len(self.walls)
+        self.num_cols = len(self.walls[0]) if self.num_rows > 0 else 0
+        self.wall_bitmap = bytearray(self.num_rows * self.num_cols)
+        self.cell_ids = [NO_CELL] * (self.num_rows * self.num_cols)
+        self.cell_positions = []
+        for row in range(self.num_rows):
+            for col in range(self.num_cols):
+                if self.walls[row][col]:
+                    self.wall_bitmap[row * self.num_cols + col] = 1
+                else:
+                    self.cell_ids[row * self.num_cols + col] = len(self.cell_positions)
+                    self.cell_positions.append((row, col))
+        self.num_cells = len(self.cell_positions)
+
+        self.neighbours = {}
+        for (direction, (delta_row, delta_col)) in DIRECTIONS.items():
+            self.neighbours[direction] = [self.cell_of((row + delta_row, col + delta_col))
+                                          for (row, col) in self.cell_positions]
+
+        self.agent_goal_cells = {self.cell_of(goal_position): goal_char
+                                 for (goal_position, goal_char, _) in self.agent_goals}
+        self.box_goal_cells = {self.cell_of(goal_position): goal_char
+                               for (goal_position, goal_char, _) in self.box_goals}
+
+        # A separate seeded random generator is used for the Zobrist table, such that hash values are reproducible and
+        # the global random generator (used to shuffle actions) is left untouched.
+        zobrist_random = random.Random(0)
+        self.zobrist = {char: [zobrist_random.getrandbits(ZOBRIST_BITS) for _ in range(self.num_cells)]
+                        for char in sorted(self.colors)}
+
+        # The distance tables computed by distances_from, by their source cell
+        self._distances = {}
+
     @staticmethod
     def parse_level_lines(level_lines):
         # Reverse the lines in the level file such that we can efficiently read the next line using 'pop'
@@ -123,25 +185,52 @@ class HospitalLevel:
                 if 'A' <= char <= 'Z':
                     box_goals.append(((row, col), char, True))
 
-        return HospitalLevel(level_name, walls, colors, agent_goals, box_goals, initial_agent_positions, initial_box_positions)
+        return HospitalLevel(level_name, walls, colors, agent_goals, box_goals, initial_agent_positions,
+                             initial_box_positions)
+
+    def cell_of(self, position):
+        """Returns the cell id of the given position, or NO_CELL if there is a wall at the position"""
+        row, col = position
+        if 0 <= row < self.num_rows and 0 <= col < self.num_cols:
+            return self.cell_ids[row * self.num_cols + col]
+        return NO_CELL
+
+    def position_of(self, cell):
+        """Returns the position of the given cell id"""
+        return self.cell_positions[cell]
+
+    def distances_from(self, cell):
+        """
+        Returns a list holding the length of the shortest path from the given cell id to every cell id, ignoring all
+        agents and boxes, or None for the cells which cannot be reached. The lists are computed by a breadth-first
+        search the first time they are requested and shared afterwards, so they must not be modified.
+        """
+        distances = self._distances.get(cell)
+        if distances is None:
+            distances = [None] * self.num_cells
+            distances[cell] = 0
+            queue = collections.deque([cell])
+            while len(queue) > 0:
+                current_cell = queue.popleft()
+                for neighbours in self.neighbours.values():
+                    neighbour_cell = neighbours[current_cell]
+                    if neighbour_cell != NO_CELL and distances[neighbour_cell] is None:
+                        distances[neighbour_cell] = distances[current_cell] + 1
+                        queue.append(neighbour_cell)
+            self._distances[cell] = distances
+        return distances
 
     def wall_at(self, position):
         """Returns True if there is a wall at the requested position and False otherwise"""
-        return self.walls[position[0]][position[1]]
+        return self.wall_bitmap[position[0] * self.num_cols + position[1]] == 1
 
     def agent_goal_at(self, position):
         """If there is an agent goal at the requested position, its letter is returned and None otherwise"""
-        for (goal_position, goal_letter, _) in self.agent_goals:
-            if goal_position == position:
-                return goal_letter
-        return None
+        return self.agent_goal_cells.get(self.cell_of(position))
 
     def box_goal_at(self, position):
         """If there is a box goal at the requested position, its letter is returned and None otherwise"""
-        for (goal_position, goal_letter, _) in self.box_goals:
-            if goal_position == position:
-                return goal_letter
-        return None
+        return self.box_goal_cells.get(self.cell_of(position))
 
     def goal_at(self, position):
         """If there is a goal at the requested position, its letter is returned and None otherwise"""
@@ -11,54 +11,205 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import copy
+import bisect
 import itertools
 import random
+import struct
+from array import array
+from domains.hospital.level import NO_CELL
+from domains.hospital.successors import compile_action_library
 # Set fixed seed for random shuffle (ensures deterministic runs)
 random.seed(a=0, version=2)
 
+# Cell ids are packed as unsigned 16 bit integers in the native byte order, which is plenty for any level
+CELL_TYPECODE = 'H'
+CELL_SIZE = 2
+_cell_struct = struct.Struct('=' + CELL_TYPECODE)
+
+
+def pack_cells(cells):
+    """Packs an iterable of cell ids into an immutable byte buffer"""
+    return array(CELL_TYPECODE, cells).tobytes()
+
+
+def unpack_cells(buffer):
+    """Unpacks a byte buffer created by pack_cells into a list of cell ids"""
+    return array(CELL_TYPECODE, buffer).tolist()
+
+
+def find_cell(buffer, cell, chars):
+    """
+    Returns the index of the first object in a byte buffer created by pack_cells which is in the given cell, or -1 if
+    there is none. Objects whose character in chars is '' (i.e. filtered objects) are skipped. The buffer is searched
+    for the packed cell id directly, and matches which are not aligned with a cell id are skipped as well.
+    """
+    packed_cell = _cell_struct.pack(cell)
+    offset = buffer.find(packed_cell)
+    while offset >= 0:
+        if offset % CELL_SIZE == 0 and chars[offset // CELL_SIZE] != '':
+            return offset // CELL_SIZE
+        offset = buffer.find(packed_cell, offset + 1)
+    return -1
+
 
 class HospitalState:
     """
     HospitalState stores all *dynamic* information regarding a state in the hospital state,
     that is, it only contains the agent positions and the box positions.
-    Both agent and box positions are stored in the format (position, character).
+    In order to keep every state small, the positions are packed as cell ids (see HospitalLevel.cell_of)
+    into two immutable byte buffers, agent_cells and box_cells. The characters never change during a search, so they
+    are kept once in the agent_chars and box_chars tuples, which are shared by all states derived from the same state.
+    Boxes are ordered by character and then by cell, so that boxes with the same character are indistinguishable.
+    Apart from the hash value, a state keeps no derived data such as an occupancy index (see occupancy), since that
+    would be kept alive by every state in the frontier and the search tree.
+    The agent_positions and box_positions properties still provide a view of the positions in the format
+    (position, character).
     Note that the index of a particular agents and boxes is *not* necessarily fixed across states.
     """
 
-    level = None
+    __slots__ = ('level', 'agent_chars', 'box_chars', 'agent_cells', 'box_cells', 'parent', 'action', 'path_cost',
+                 '_hash', '_moves')
 
     def __init__(self, level, agent_positions, box_positions, parent=None, action=None):
+        box_positions = sorted(box_positions, key=lambda box: (box[1], box[0]))
         self.level = level
-        self.agent_positions = agent_positions
-        self.box_positions = box_positions
+        self.agent_chars = tuple(agent_char for (_, agent_char) in agent_positions)
+        self.box_chars = tuple(box_char for (_, box_char) in box_positions)
+        self.agent_cells = pack_cells(level.cell_of(agent_position) for (agent_position, _) in agent_positions)
+        self.box_cells = pack_cells(level.cell_of(box_position) for (box_position, _) in box_positions)
         self.parent = parent
         self.action = action
         self.path_cost = 0 if parent is None else parent.path_cost + 1
 
+        # The Zobrist hash value of the state, which is the XOR of the Zobrist keys of all its objects.
+        # It is computed once here and afterwards updated incrementally whenever an object is moved.
+        self._hash = 0
+        for (cell, char) in itertools.chain(zip(unpack_cells(self.agent_cells), self.agent_chars),
+                                            zip(unpack_cells(self.box_cells), self.box_chars)):
+            if char != '':
+                self._hash ^= level.zobrist[char][cell]
+
+        # The moves recorded by move_agent and move_box while 'result' constructs this state (see 'result')
+        self._moves = None
+
+    @property
+    def agent_positions(self):
+        """A list of the agent positions in the format (position, character). It is created on every access."""
+        cell_positions = self.level.cell_positions
+        return [(cell_positions[cell], agent_char)
+                for (cell, agent_char) in zip(unpack_cells(self.agent_cells), self.agent_chars)]
+
+    @property
+    def box_positions(self):
+        """A list of the box positions in the format (position, character). It is created on every access."""
+        cell_positions = self.level.cell_positions
+        return [(cell_positions[cell], box_char)
+                for (cell, box_char) in zip(unpack_cells(self.box_cells), self.box_chars)]
+
+    def agent_cell(self, agent_index):
+        """Returns the cell id of the agent with the given index"""
+        cell, = _cell_struct.unpack_from(self.agent_cells, agent_index * CELL_SIZE)
+        return cell
+
+    def box_cell(self, box_index):
+        """Returns the cell id of the box with the given index"""
+        cell, = _cell_struct.unpack_from(self.box_cells, box_index * CELL_SIZE)
+        return cell
+
+    def get_agent(self, agent_index):
+        """Returns the position and character of the agent with the given index"""
+        return self.level.cell_positions[self.agent_cell(agent_index)], self.agent_chars[agent_index]
+
+    def get_box(self, box_index):
+        """Returns the position and character of the box with the given index"""
+        return self.level.cell_positions[self.box_cell(box_index)], self.box_chars[box_index]
+
+    def occupancy(self):
+        """
+        Returns the occupancy index which maps every occupied cell to the index of the agent or box in that cell.
+        Agent indices are stored as is, while a box index is stored as -1 - index such that the two can be told apart.
+        Filtered objects (character '') do not occupy any cell and are therefore left out of the index.
+        The index is built on every call and not kept by the state, such that states do not pay for it in memory. The
+        lookups of single cells below search the cells of the state directly instead (see find_cell), so the index is
+        only worth building for many lookups in the same state, e.g. while the state is expanded.
+        """
+        occupancy = {}
+        for (idx, (cell, box_char)) in enumerate(zip(unpack_cells(self.box_cells), self.box_chars)):
+            if box_char != '':
+                occupancy[cell] = -1 - idx
+        for (idx, (cell, agent_char)) in enumerate(zip(unpack_cells(self.agent_cells), self.agent_chars)):
+            if agent_char != '':
+                occupancy[cell] = idx
+        return occupancy
+
+    def move_agent(self, agent_index, new_cell):
+        """
+        Moves the agent with the given index to new_cell and updates the hash value accordingly.
+        This may only be used by actions while 'result' constructs a new state. The move is only recorded here,
+        and the cells of the new state are built from all recorded moves once every action has been applied.
+        """
+        zobrist_keys = self.level.zobrist[self.agent_chars[agent_index]]
+        self._hash ^= zobrist_keys[self.agent_cell(agent_index)] ^ zobrist_keys[new_cell]
+        self._moves.append((False, agent_index, new_cell))
+
+    def move_box(self, box_index, new_cell):
+        """
+        Moves the box with the given index to new_cell and updates the hash value accordingly.
+        This may only be used by actions while 'result' constructs a new state. The move is only recorded here,
+        and the cells of the new state are built from all recorded moves once every action has been applied.
+        """
+        zobrist_keys = self.level.zobrist[self.box_chars[box_index]]
+        self._hash ^= zobrist_keys[self.box_cell(box_index)] ^ zobrist_keys[new_cell]
+        self._moves.append((True, box_index, new_cell))
+
+    def agent_at_cell(self, cell):
+        """
+        Returns the index and character of the agent in the given cell.
+        If there is no agent in the cell, -1,'' is returned instead.
+        """
+        idx = find_cell(self.agent_cells, cell, self.agent_chars)
+        if idx < 0:
+            return -1, ''
+        return idx, self.agent_chars[idx]
+
+    def box_at_cell(self, cell):
+        """
+        Returns the index and character of the box in the given cell.
+        If there is no box in the cell, -1,'' is returned instead.
+        """
+        idx = find_cell(self.box_cells, cell, self.box_chars)
+        if idx < 0:
+            return -1, ''
+        return idx, self.box_chars[idx]
+
+    def object_at_cell(self, cell):
+        """Returns the character of the object in the given cell, or '' if the cell is empty"""
+        idx = find_cell(self.agent_cells, cell, self.agent_chars)
+        if idx >= 0:
+            return self.agent_chars[idx]
+        idx = find_cell(self.box_cells, cell, self.box_chars)
+        if idx >= 0:
+            return self.box_chars[idx]
+        return ''
+
+    def free_at_cell(self, cell):
+        """Returns True iff cell is a free cell (i.e. not NO_CELL) without any objects in it"""
+        return cell != NO_CELL and find_cell(self.agent_cells, cell, self.agent_chars) < 0 and \
+            find_cell(self.box_cells, cell, self.box_chars) < 0
+
     def agent_at(self, position):
         """
         Returns the index and character of the agent at the given position.
         If there is no agent at the position, -1,'' is returned instead.
         """
-        for (idx, (agent_position, agent_char)) in enumerate(self.agent_positions):
-            if agent_char == '':
-                continue
-            if agent_position == position:
-                return idx, agent_char
-        return -1, ''
+        return self.agent_at_cell(self.level.cell_of(position))
 
     def box_at(self, position):
         """
         Returns the index and character of the box at the given position.
         If there is no box at the position, -1,'' is returned instead.
         """
-        for (idx, (box_position, box_char)) in enumerate(self.box_positions):
-            if box_char == '':
-                continue
-            if box_position == position:
-                return idx, box_char
-        return -1, ''
+        return self.box_at_cell(self.level.cell_of(position))
 
     def object_at(self, position):
         """
@@ -66,18 +217,40 @@ class HospitalState:
         It can be used for checks where we do not care whether it is an agent or a box, e.g. when checking
         for obstacles. If there is no object at the position, -1,'' is returned instead.
         """
-        idx, agent_char = self.agent_at(position)
-        if agent_char != '':
-            return agent_char
-        else:
-            idx, box_char = self.box_at(position)
-            return box_char
+        return self.object_at_cell(self.level.cell_of(position))
 
     def free_at(self, position):
         """Returns True iff there are no objects at the requested location"""
-        return not self.level.wall_at(position) and \
-               self.agent_at(position)[1] == '' and \
-               self.box_at(position)[1] == ''
+        return self.free_at_cell(self.level.cell_of(position))
+
+    def key(self):
+        """
+        Returns a compact key identifying the positions in this state. Since the characters are not part of the key,
+        keys should only be compared between states from the same search, i.e. states sharing the same characters.
+        """
+        return self.agent_cells + self.box_cells
+
+    def state_of_key(self, key):
+        """
+        Returns a new root state with the positions of the given key (see key) and the characters of this state.
+        This allows a search to store or send states as keys only, and to rebuild them when they are needed.
+        """
+        new_state = object.__new__(HospitalState)
+        new_state.level = self.level
+        new_state.agent_chars = self.agent_chars
+        new_state.box_chars = self.box_chars
+        new_state.agent_cells = key[:len(self.agent_cells)]
+        new_state.box_cells = key[len(self.agent_cells):]
+        new_state.parent = None
+        new_state.action = None
+        new_state.path_cost = 0
+        new_state._hash = 0
+        for (cell, char) in itertools.chain(zip(unpack_cells(new_state.agent_cells), self.agent_chars),
+                                            zip(unpack_cells(new_state.box_cells), self.box_chars)):
+            if char != '':
+                new_state._hash ^= self.level.zobrist[char][cell]
+        new_state._moves = None
+        return new_state
 
     def extract_plan(self):
         """Extracts a plan from the search tree by walking backwards through the search tree"""
@@ -98,7 +271,7 @@ class HospitalState:
 
         for agent_index, action in enumerate(joint_action):
             # We ignore actions for filtered agents
-            if self.agent_positions[agent_index][1] == '':
+            if self.agent_chars[agent_index] == '':
                 continue
             # Compute destinations and moved boxes for action
             action_destinations, action_boxes = action.conflicts(agent_index, self)
@@ -117,15 +290,51 @@ class HospitalState:
 
     def result(self, joint_action):
         """Computes the state resulting from applying a joint action to this state"""
-        new_state = HospitalState(self.level, copy.copy(self.agent_positions), copy.copy(self.box_positions),
-                                  self, joint_action)
+        new_state = object.__new__(HospitalState)
+        new_state.level = self.level
+        new_state.agent_chars = self.agent_chars
+        new_state.box_chars = self.box_chars
+        new_state.parent = self
+        new_state.action = joint_action
+        new_state.path_cost = self.path_cost + 1
+        new_state._hash = self._hash
+
+        # While the actions are applied, the new state shares the cells of this state, and every move is only recorded.
+        # All actions of a joint action are evaluated with respect to the state they are applied in, and since the
+        # joint action is conflict free, no action will ever look up a cell moved by another.
+        new_state.agent_cells = self.agent_cells
+        new_state.box_cells = self.box_cells
+        new_state._moves = moves = []
 
         for (agent_index, action) in enumerate(joint_action):
             action.result(agent_index, new_state)
 
-        # Sorting the box positions ensures that the boxes are indistinguishable which significantly
-        # reduces the search space size.
-        new_state.box_positions.sort()
+        # The cells of the new state are now built in one step. Buffers without any moves stay shared with this state.
+        if moves:
+            agent_cells = None
+            box_cells = None
+            for (is_box, idx, new_cell) in moves:
+                if not is_box:
+                    if agent_cells is None:
+                        agent_cells = array(CELL_TYPECODE, self.agent_cells)
+                    agent_cells[idx] = new_cell
+                else:
+                    if box_cells is None:
+                        box_cells = array(CELL_TYPECODE, self.box_cells)
+                    # Boxes are sorted by character and then by cell, which ensures that boxes with the same character
+                    # are indistinguishable and significantly reduces the search space size. A moved box can only change
+                    # its place among the boxes with the same character, so it is removed from that run and inserted
+                    # into it again. The hash value is independent of the order of the objects.
+                    box_char = self.box_chars[idx]
+                    lo = self.box_chars.index(box_char)
+                    hi = lo + self.box_chars.count(box_char)
+                    del box_cells[bisect.bisect_left(box_cells, self.box_cell(idx), lo, hi)]
+                    bisect.insort(box_cells, new_cell, lo, hi - 1)
+            if agent_cells is not None:
+                new_state.agent_cells = agent_cells.tobytes()
+            if box_cells is not None:
+                new_state.box_cells = box_cells.tobytes()
+        new_state._moves = None
 
         return new_state
 
@@ -133,7 +342,7 @@ class HospitalState:
         """Computes the state resulting from applying a sequence of joint actions (a plan) to this state"""
         # If the plan is empty, just return a new copy of the current state
         if len(plan) == 0:
-            return HospitalState(self.level, copy.copy(self.agent_positions), copy.copy(self.box_positions))
+            return HospitalState(self.level, self.agent_positions, self.box_positions)
         # Otherwise, result each action in the plan
         new_state = self.result(plan[0])
         for joint_action in plan[1:]:
@@ -149,30 +358,88 @@ class HospitalState:
 
     def get_applicable_actions(self, action_set):
         """Returns a list of all applicable joint_action in this state"""
-        num_agents = len(self.agent_positions)
+        num_agents = len(self.agent_chars)
 
         # Determine all applicable actions for each individual agent, i.e. without consideration of conflicts.
+        # The compiled action library finds the ids of the applicable actions in a single pass (see successors.py).
         applicable_actions = [[] for _ in range(num_agents)]
+        # The occupancy index is built once for all agents and dropped again after the expansion
+        occupancy = self.occupancy()
 
         for agent_index in range(num_agents):
-            for action in action_set[agent_index]:
-                if action.is_applicable(agent_index, self):
-                    applicable_actions[agent_index].append(action)
+            actions = action_set[agent_index]
+            compiled_actions = compile_action_library(actions)
+            for action_id in compiled_actions.applicable_action_ids(self, agent_index, occupancy):
+                applicable_actions[agent_index].append(actions[action_id])
 
-        # Determine all applicable joint actions, but checking all combinations of the individual applicable actions
+        # Determine all applicable joint actions, i.e. all conflict free combinations of the individual actions
         # We can skip this step if there only is one agent
         applicable_joint_actions = []
         if num_agents == 1:
             for action in applicable_actions[0]:
                 applicable_joint_actions.append([action])
         else:
-            for joint_action in itertools.product(*applicable_actions):
-                if not self.is_conflicting(joint_action):
-                    applicable_joint_actions.append(joint_action)
+            applicable_joint_actions = self.enumerate_joint_actions(applicable_actions)
 
         random.shuffle(applicable_joint_actions)
         return applicable_joint_actions
 
+    def enumerate_joint_actions(self, applicable_actions):
+        """
+        Returns all conflict free joint actions which can be combined from the individual applicable actions.
+        This gives the same result as filtering every combination with is_conflicting, but the joint actions are built
+        one agent at a time and a partial joint action is abandoned as soon as it conflicts. The cost therefore depends
+        on the number of conflict free joint actions rather than the number of combinations.
+        """
+        num_agents = len(applicable_actions)
+
+        # The conflicts of each individual action are computed once, rather than once per joint action.
+        # We ignore actions for filtered agents, just like is_conflicting.
+        options = []
+        for (agent_index, actions) in enumerate(applicable_actions):
+            if self.agent_chars[agent_index] == '':
+                options.append([(action, [], []) for action in actions])
+            else:
+                options.append([(action, *action.conflicts(agent_index, self)) for action in actions])
+
+        joint_actions = []
+        joint_action = [None] * num_agents
+        # All previously free cells which either an agent or box will move into during the partial joint action
+        destinations = set()
+        # All cells currently containing a box which will be moved during the partial joint action
+        active_boxes = set()
+
+        def extend(agent_index):
+            if agent_index == num_agents:
+                joint_actions.append(tuple(joint_action))
+                return
+            for (action, action_destinations, action_boxes) in options[agent_index]:
+                # Claim the destinations and boxes of the action, undoing the claims again if a conflict is found
+                claimed_destinations = []
+                claimed_boxes = []
+                conflicting = False
+                for dest in action_destinations:
+                    if dest in destinations:
+                        conflicting = True
+                        break
+                    destinations.add(dest)
+                    claimed_destinations.append(dest)
+                if not conflicting:
+                    for box in action_boxes:
+                        if box in active_boxes:
+                            conflicting = True
+                            break
+                        active_boxes.add(box)
+                        claimed_boxes.append(box)
+                if not conflicting:
+                    joint_action[agent_index] = action
+                    extend(agent_index + 1)
+                destinations.difference_update(claimed_destinations)
+                active_boxes.difference_update(claimed_boxes)
+
+        extend(0)
+        return joint_actions
+
     def color_filter(self, color):
         """
         Returns a copy of the current state where all entities, of another color than the color passed as an argument,
@@ -195,13 +462,29 @@ class HospitalState:
 
         return HospitalState(self.level, filtered_agent_positions, filtered_box_positions)
 
+    def colors_filter(self, colors):
+        """
+        Returns a copy of the current state where all entities, of another color than the colors passed as an argument,
+        has been removed
+        """
+        filtered_agent_positions = [(agent_position, agent_char)
+                                    for (agent_position, agent_char) in self.agent_positions
+                                    if self.level.colors[agent_char] in colors]
+        filtered_box_positions = [(box_position, box_char)
+                                  for (box_position, box_char) in self.box_positions
+                                  if self.level.colors[box_char] in colors]
+        return HospitalState(self.level, filtered_agent_positions, filtered_box_positions)
+
     def __eq__(self, other):
         """
         Notice that we here only compare the agent positions and box positions, but ignore all other fields.
         That means that two states with identical positions but e.g. different parent will be seen as equal.
         """
         if isinstance(other, self.__class__):
-            return self.agent_positions == other.agent_positions and self.box_positions == other.box_positions
+            # Comparing the hash values first rejects almost all unequal states without looking at the positions
+            return self._hash == other._hash and \
+                   self.agent_cells == other.agent_cells and self.box_cells == other.box_cells and \
+                   self.agent_chars == other.agent_chars and self.box_chars == other.box_chars
         else:
             return False
 
@@ -213,8 +496,9 @@ class HospitalState:
         Allows the state to be stored in a hash table for efficient lookup.
         Notice that we here only hash the agent positions and box positions, but ignore all other fields.
         That means that two states with identical positions but e.g. different parent will map to the same hash value.
+        The hash value is the Zobrist hash of the positions, which is maintained incrementally (see move_agent).
         """
-        return hash((tuple(self.agent_positions), tuple(self.box_positions)))
+        return self._hash
 
     def __repr__(self):
         lines = []
@@ -0,0 +1,117 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from domains.hospital.actions import NoOpAction, MoveAction, PushAction, PullAction, opposite_directions
+from domains.hospital.level import DIRECTIONS, NO_CELL
+
+
+class CompiledActionLibrary:
+    """
+    An action library compiled into lookup tables from directions into action ids, where an action id is the index of
+    an action in the action library. This allows all applicable actions of an agent to be found in a single pass over
+    the four neighbours of the agent, instead of letting every action in the library repeat the same cell lookups.
+    - move_ids maps an agent direction into a list of (action_id, sticky) pairs.
+    - push_ids and pull_ids map an agent direction into a list of (box_direction, action_id, sticky) triplets.
+    - noop_ids and other_ids contain the NoOp actions and the actions of unknown types. The latter are checked using
+      their own is_applicable method, such that any action library can be compiled.
+    """
+
+    def __init__(self, actions):
+        self.actions = actions
+        self.noop_ids = []
+        self.other_ids = []
+        self.move_ids = {direction: [] for direction in DIRECTIONS}
+        self.push_ids = {direction: [] for direction in DIRECTIONS}
+        self.pull_ids = {direction: [] for direction in DIRECTIONS}
+
+        for (action_id, action) in enumerate(actions):
+            if isinstance(action, NoOpAction):
+                self.noop_ids.append(action_id)
+            elif isinstance(action, MoveAction):
+                self.move_ids[action.agent_direction].append((action_id, action.sticky))
+            elif isinstance(action, PushAction):
+                self.push_ids[action.agent_direction].append((action.box_direction, action_id, action.sticky))
+            elif isinstance(action, PullAction):
+                self.pull_ids[action.agent_direction].append((action.box_direction, action_id, action.sticky))
+            else:
+                self.other_ids.append(action_id)
+
+    def applicable_action_ids(self, state, agent_index, occupancy):
+        """
+        Returns the sorted ids of all actions applicable for the agent with 'agent_index' in 'state', independently
+        of any other action performed by other agents. This is equivalent to checking 'is_applicable' of every action.
+        'occupancy' is the occupancy index of the state (see HospitalState.occupancy).
+        """
+        level = state.level
+        neighbours = level.neighbours
+        agent_cell = state.agent_cell(agent_index)
+        agent_char = state.agent_chars[agent_index]
+        agent_on_goal = level.agent_goal_cells.get(agent_cell) == agent_char
+
+        action_ids = [action_id for action_id in self.other_ids
+                      if self.actions[action_id].is_applicable(agent_index, state)]
+        # NoOp can never change the state if we only have a single agent
+        if len(state.agent_chars) > 1:
+            action_ids.extend(self.noop_ids)
+
+        # A single pass over the neighbours of the agent finds the free cells and the boxes the agent may move
+        free_directions = []
+        boxes = {}
+        for direction in DIRECTIONS:
+            cell = neighbours[direction][agent_cell]
+            if cell == NO_CELL:
+                continue
+            idx = occupancy.get(cell)
+            if idx is None:
+                free_directions.append(direction)
+            elif idx < 0:
+                box_char = state.box_chars[-1 - idx]
+                if level.colors[box_char] == level.colors[agent_char]:
+                    box_on_goal = level.box_goal_cells.get(cell) == box_char
+                    boxes[direction] = (cell, box_on_goal)
+
+        for direction in free_directions:
+            for (action_id, sticky) in self.move_ids[direction]:
+                if not (sticky and agent_on_goal):
+                    action_ids.append(action_id)
+            # A Pull moves the agent into the free cell and the box from the opposite side of the agent into its cell
+            for (box_direction, action_id, sticky) in self.pull_ids[direction]:
+                box = boxes.get(opposite_directions[box_direction])
+                if box is not None and not (sticky and (agent_on_goal or box[1])):
+                    action_ids.append(action_id)
+
+        for (direction, (box_cell, box_on_goal)) in boxes.items():
+            # A Push moves the agent into the cell of the box and the box into the next cell, which must be free
+            for (box_direction, action_id, sticky) in self.push_ids[direction]:
+                new_box_cell = neighbours[box_direction][box_cell]
+                if new_box_cell != NO_CELL and new_box_cell not in occupancy and \
+                        not (sticky and (agent_on_goal or box_on_goal)):
+                    action_ids.append(action_id)
+
+        # Returning the ids in library order makes the result independent of the order of the lookups above
+        action_ids.sort()
+        return action_ids
+
+
+# The compiled action libraries are cached by the identity of the action library. The library itself is kept in the
+# cache as well, which ensures that its identity is never reused by another library.
+_compiled_action_libraries = {}
+
+
+def compile_action_library(actions):
+    """Returns the compiled version of the action library, compiling it the first time the library is seen"""
+    entry = _compiled_action_libraries.get(id(actions))
+    if entry is None:
+        entry = (actions, CompiledActionLibrary(actions))
+        _compiled_action_libraries[id(actions)] = entry
+    return entry[1]
@@ -14,13 +14,73 @@
 from math import inf
 import os
 import psutil
+import time
 
 max_usage = inf
-_process_id = psutil.Process
+# How often a MemoryGuard samples the actual memory usage, in seconds and in expansions, whichever comes first.
+# The searchclient sets these from the command line.
+sample_interval_seconds = 0.1
+sample_interval_expansions = 1000
+
+# The process object is created once per process, since creating it is about as expensive as reading the usage
+_process = None
 
 
 def get_usage():
-    process = psutil.Process(os.getpid())
-    return process.memory_info().rss
+    global _process
+    if _process is None or _process.pid != os.getpid():
+        _process = psutil.Process(os.getpid())
+    return _process.memory_info().rss
+
+
+def get_anonymous_usage():
+    """
+    Returns the memory usage without the resident pages which are backed by files, such as memory-mapped files, since
+    the operating system can reclaim these at any time. On platforms where psutil does not report the file-backed
+    pages, this is the same as get_usage.
+    """
+    global _process
+    if _process is None or _process.pid != os.getpid():
+        _process = psutil.Process(os.getpid())
+    memory_info = _process.memory_info()
+    return memory_info.rss - getattr(memory_info, 'shared', 0)
+
+
+class MemoryGuard:
+    """
+    Enforces the soft memory limit during a search without reading the memory usage in every iteration.
+    The actual usage is only sampled at the configured intervals. Between two samples, the usage is extrapolated from
+    the growth of the number of states the search holds (e.g. closed plus frontier states), using the number of bytes
+    per state observed between the last samples. If the extrapolated usage exceeds the limit, a sample is taken at
+    once, such that the search is never aborted on an estimate alone.
+    The usage is read with the given function, e.g. get_anonymous_usage for a search which memory-maps files.
+    """
+
+    def __init__(self, usage_function=get_usage):
+        self.usage_function = usage_function
+        self.last_sample_time = time.time()
+        self.last_usage = usage_function()
+        self.last_num_states = 0
+        self.bytes_per_state = 0.0
+        self.expansions_since_sample = 0
+
+    def exceeded(self, num_states):
+        """Returns True iff the memory usage exceeds max_usage. It should be called once per expansion."""
+        self.expansions_since_sample += 1
+        if self.expansions_since_sample < sample_interval_expansions and \
+                time.time() - self.last_sample_time < sample_interval_seconds:
+            estimated_usage = self.last_usage + (num_states - self.last_num_states) * self.bytes_per_state
+            if estimated_usage <= max_usage:
+                return False
+        return self.sample(num_states) > max_usage
 
-    
\ No newline at end of file
+    def sample(self, num_states):
+        """Reads the actual memory usage and updates the growth estimate from it"""
+        usage = self.usage_function()
+        if num_states > self.last_num_states:
+            self.bytes_per_state = max(0.0, (usage - self.last_usage) / (num_states - self.last_num_states))
+        self.last_sample_time = time.time()
+        self.last_usage = usage
+        self.last_num_states = num_states
+        self.expansions_since_sample = 0
+        return usage
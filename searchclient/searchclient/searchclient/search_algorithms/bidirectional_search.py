@@ -0,0 +1,233 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import heapq
+import itertools
+import sys
+import time
+import memory
+from domains.hospital.actions import reverse_action_library
+from domains.hospital.goal_description import HospitalGoalDescription
+
+
+def can_search_bidirectionally(initial_state, action_set, goal_description):
+    """
+    Returns whether bidirectional_search can be used, which requires a single agent, a goal description placing all
+    boxes, and an action library where every action can be reversed.
+    """
+    return len(action_set) == 1 and \
+        reverse_action_library(action_set[0]) is not None and \
+        goal_description.goal_states(initial_state) is not None
+
+
+def bidirectional_search(initial_state, action_set, goal_description):
+    """
+    A bidirectional breadth-first search, which searches forward from the initial state and backward from the goal
+    states (see goal_description.goal_states) until the two searches meet. The backward search applies the reversed
+    action library (see reverse_action_library), so it generates the predecessors of the states.
+    The searches take turns to expand an entire layer, always the smaller one. All children of the layer are checked
+    against the states seen by the other search, and the shortest plan through any of them is returned.
+    """
+    start_time = time.time()
+    memory_guard = memory.MemoryGuard()
+
+    initial_state.parent = None
+    initial_state.path_cost = 0
+    goal_states = goal_description.goal_states(initial_state)
+
+    reversed_action_set = [reverse_action_library(actions) for actions in action_set]
+
+    # The seen maps hold every state generated in each direction, mapped to itself such that the path to a state
+    # can be retrieved from the stored instance
+    forward_seen = {initial_state: initial_state}
+    backward_seen = {goal_state: goal_state for goal_state in goal_states}
+    forward_layer = [initial_state]
+    backward_layer = goal_states
+    if initial_state in backward_seen:
+        return True, []
+    iterations = 0
+
+    while len(forward_layer) > 0 and len(backward_layer) > 0:
+        forward = len(forward_layer) <= len(backward_layer)
+        if forward:
+            layer, seen, other_seen, layer_action_set = forward_layer, forward_seen, backward_seen, action_set
+        else:
+            layer, seen, other_seen, layer_action_set = backward_layer, backward_seen, forward_seen, reversed_action_set
+
+        next_layer = []
+        # The pair (forward state, backward state) of the shortest plan found so far in this layer
+        meeting = None
+        for state in layer:
+            # Print a progress status message every 10000 iterations
+            if iterations % 10000 == 0 and iterations != 0:
+                print_bidirectional_search_status(start_time, forward_seen, backward_seen)
+
+            # Ensure that we do not use more memory than allowed
+            if memory_guard.exceeded(len(forward_seen) + len(backward_seen)):
+                print('Maximum memory usage exceeded!', file=sys.stderr, flush=True)
+                sys.exit(-1)
+
+            for joint_action in state.get_applicable_actions(layer_action_set):
+                child = state.result(joint_action)
+                if child in seen:
+                    continue
+                seen[child] = child
+                next_layer.append(child)
+
+                other = other_seen.get(child)
+                if other is not None:
+                    length = child.path_cost + other.path_cost
+                    if meeting is None or length < meeting[0].path_cost + meeting[1].path_cost:
+                        meeting = (child, other) if forward else (other, child)
+            iterations += 1
+
+        if meeting is not None:
+            print_bidirectional_search_status(start_time, forward_seen, backward_seen)
+            forward_state, backward_state = meeting
+            return True, forward_state.extract_plan() + extract_reversed_plan(backward_state, action_set,
+                                                                              reversed_action_set)
+
+        if forward:
+            forward_layer = next_layer
+        else:
+            backward_layer = next_layer
+
+    # One of the searches has seen every state reachable in its direction without meeting the other
+    return False, []
+
+
+def bidirectional_a_star_search(initial_state, action_set, goal_description, heuristic):
+    """
+    A front-to-end bidirectional A* search, which searches forward from the initial state towards the goal states and
+    backward from the goal states towards the initial state. The forward search orders its states by g + h with the
+    given heuristic for the goal description, and the backward search by g + h with a copy of the heuristic for a goal
+    description placing every object where it is in the initial state.
+    The direction with the fewest open states is expanded. Every generated state is checked against the states seen by
+    the other search, and the search stops when the lowest f value of the open states in either direction is no lower
+    than the cost of the shortest plan through a meeting state, since every cheaper plan would pass an open state of
+    both directions. A state reached with a lower cost than before is opened again, so the plan is optimal whenever the
+    heuristic is admissible.
+    """
+    start_time = time.time()
+    memory_guard = memory.MemoryGuard()
+
+    initial_state.parent = None
+    initial_state.path_cost = 0
+    goal_states = goal_description.goal_states(initial_state)
+    if initial_state in goal_states:
+        return True, []
+
+    reversed_action_set = [reverse_action_library(actions) for actions in action_set]
+    initial_goals = [(position, char, True) for (position, char) in initial_state.agent_positions] + \
+                    [(position, char, True) for (position, char) in initial_state.box_positions]
+    initial_goal_description = HospitalGoalDescription(goal_description.level, initial_goals)
+    # The heuristics keep data for the goal description they were last used with, so each direction has its own
+    backward_heuristic = copy.deepcopy(heuristic)
+
+    # The seen maps hold the cheapest instance of every state generated in each direction, and the open lists hold
+    # entries (f, h, count, state), where an entry is stale once the seen map holds a cheaper instance of its state
+    counter = itertools.count()
+    forward_seen = {initial_state: initial_state}
+    backward_seen = {goal_state: goal_state for goal_state in goal_states}
+    h = heuristic.h(initial_state, goal_description)
+    forward_open = [(h, h, next(counter), initial_state)]
+    backward_open = []
+    for (goal_state, h) in zip(goal_states, backward_heuristic.h_batch(goal_states, initial_goal_description)):
+        heapq.heappush(backward_open, (h, h, next(counter), goal_state))
+
+    # The pair (forward state, backward state) of the shortest plan found so far
+    meeting = None
+    meeting_cost = float('inf')
+    iterations = 0
+
+    while True:
+        # Drop the stale entries such that the open lists start with their lowest f values
+        for (open_list, seen) in ((forward_open, forward_seen), (backward_open, backward_seen)):
+            while len(open_list) > 0 and seen[open_list[0][3]] is not open_list[0][3]:
+                heapq.heappop(open_list)
+        if len(forward_open) == 0 or len(backward_open) == 0 or \
+                max(forward_open[0][0], backward_open[0][0]) >= meeting_cost:
+            break
+
+        # Print a progress status message every 10000 iterations
+        if iterations % 10000 == 0 and iterations != 0:
+            print_bidirectional_search_status(start_time, forward_seen, backward_seen)
+
+        # Ensure that we do not use more memory than allowed
+        if memory_guard.exceeded(len(forward_seen) + len(backward_seen)):
+            print('Maximum memory usage exceeded!', file=sys.stderr, flush=True)
+            sys.exit(-1)
+
+        forward = len(forward_open) <= len(backward_open)
+        if forward:
+            open_list, seen, other_seen = forward_open, forward_seen, backward_seen
+            layer_action_set, layer_heuristic, layer_goal_description = action_set, heuristic, goal_description
+        else:
+            open_list, seen, other_seen = backward_open, backward_seen, forward_seen
+            layer_action_set, layer_heuristic, layer_goal_description = \
+                reversed_action_set, backward_heuristic, initial_goal_description
+
+        state = heapq.heappop(open_list)[3]
+        children = []
+        for joint_action in state.get_applicable_actions(layer_action_set):
+            child = state.result(joint_action)
+            previous = seen.get(child)
+            if previous is not None and previous.path_cost <= child.path_cost:
+                continue
+            seen[child] = child
+            children.append(child)
+
+            other = other_seen.get(child)
+            if other is not None and child.path_cost + other.path_cost < meeting_cost:
+                meeting_cost = child.path_cost + other.path_cost
+                meeting = (child, other) if forward else (other, child)
+
+        for (child, h) in zip(children, layer_heuristic.h_batch(children, layer_goal_description)):
+            heapq.heappush(open_list, (child.path_cost + h, h, next(counter), child))
+        iterations += 1
+
+    if meeting is None:
+        # One of the searches has seen every state reachable in its direction without meeting the other
+        return False, []
+
+    print_bidirectional_search_status(start_time, forward_seen, backward_seen)
+    forward_state, backward_state = meeting
+    return True, forward_state.extract_plan() + extract_reversed_plan(backward_state, action_set, reversed_action_set)
+
+
+def extract_reversed_plan(backward_state, action_set, reversed_action_set):
+    """
+    Extracts the plan leading from the given state to a goal state from the path of the backward search, which
+    consists of the reverse actions in the opposite order
+    """
+    original_actions = [{id(reversed_action): action for (action, reversed_action) in zip(actions, reversed_actions)}
+                        for (actions, reversed_actions) in zip(action_set, reversed_action_set)]
+    plan = []
+    for reversed_joint_action in reversed(backward_state.extract_plan()):
+        plan.append([original_actions[agent_index][id(reversed_action)]
+                     for (agent_index, reversed_action) in enumerate(reversed_joint_action)])
+    return plan
+
+
+def print_bidirectional_search_status(start_time, forward_seen, backward_seen):
+    memory_usage_bytes = memory.get_usage()
+    # Replacing the generated comma thousands separators with dots is neither pretty nor locale aware but none of
+    # Pythons four different formatting facilities seems to handle this correctly!
+    num_forward = f"{len(forward_seen):8,d}".replace(',', '.')
+    num_backward = f"{len(backward_seen):8,d}".replace(',', '.')
+    elapsed_time = f"{time.time() - start_time:3.3f}".replace('.', ',')
+    memory_usage_mb = f"{memory_usage_bytes / (1024*1024):3.2f}".replace('.', ',')
+    status_text = f"#Forward: {num_forward}, #Backward: {num_backward}," \
+                  f" Time: {elapsed_time} s, Memory: {memory_usage_mb} MB"
+    print(status_text, file=sys.stderr)
@@ -0,0 +1,174 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import itertools
+import sys
+import time
+import memory
+from domains.hospital.actions import NoOpAction
+from search_algorithms.space_time_search import SpaceTimeConstraints, space_time_search
+
+
+class ConstraintTreeNode:
+    """
+    A node of the constraint tree, holding the constraints of every agent and the shortest paths satisfying them,
+    given as the cells and the actions of every agent (see space_time_search). The cost of the node is the sum of the
+    lengths of the paths.
+    """
+
+    def __init__(self, constraints, paths):
+        self.constraints = constraints
+        self.paths = paths
+        self.cost = sum(len(actions) for (_, actions) in paths)
+
+
+def can_search_conflict_based(initial_state, goal_description):
+    """
+    Returns whether conflict_based_search can be used, which requires a level without boxes, where every goal is a
+    positive agent goal and no agent has more than one goal.
+    """
+    goal_chars = [goal_char for (_, goal_char, _) in goal_description.goals]
+    return len(initial_state.box_chars) == 0 and \
+        len(goal_description.box_goals) == 0 and \
+        all(is_positive_literal for (_, _, is_positive_literal) in goal_description.goals) and \
+        len(set(goal_chars)) == len(goal_chars)
+
+
+def conflict_based_search(initial_state, action_library, goal_description):
+    """
+    Conflict-based search (CBS) for levels without boxes. The high level searches a constraint tree best-first by cost,
+    where the paths of every node are found by a space-time A* search for each agent on its own (see
+    space_time_search). The first conflict between two paths splits the node into two children, each adding a
+    constraint to one of the agents, such that every plan without the conflict satisfies one of the children.
+    In the hospital domain, an agent may not move into a cell occupied by another agent at the start of the action:
+    - A vertex conflict, where two agents are in the same cell at time t, forbids either agent to be there at time t.
+    - A follow conflict, where an agent moves into the cell another agent was in at time t - 1 (which includes two
+      agents swapping cells), either forbids the first agent to make that move at time t, or forbids the other agent
+      to be in the cell at time t - 1.
+    Returns a (boolean, plan) pair just like graph_search, where the plan is a list of joint actions. Plans are
+    optimal with respect to the sum of the lengths of the paths of the agents.
+    """
+    start_time = time.time()
+    memory_guard = memory.MemoryGuard()
+    level = initial_state.level
+    start_cells = [initial_state.agent_cell(agent_index) for agent_index in range(len(initial_state.agent_chars))]
+    agent_goal_cells = {goal_char: goal_cell for (goal_cell, goal_char, _) in goal_description.goal_cells}
+    goal_cells = [agent_goal_cells.get(agent_char) for agent_char in initial_state.agent_chars]
+
+    def find_path(agent_index, constraints):
+        return space_time_search(level, action_library, start_cells[agent_index], goal_cells[agent_index], constraints)
+
+    root_constraints = [SpaceTimeConstraints() for _ in start_cells]
+    root_paths = [find_path(agent_index, constraints) for (agent_index, constraints) in enumerate(root_constraints)]
+    if None in root_paths:
+        return False, []
+
+    # The open list holds entries (cost, count, node), where ties are broken in favour of the newest node
+    counter = itertools.count()
+    root = ConstraintTreeNode(root_constraints, root_paths)
+    open_list = [(root.cost, 0, root)]
+    num_expanded = 0
+    last_status_time = time.time()
+
+    while len(open_list) > 0:
+        if memory_guard.exceeded(len(open_list)):
+            print_conflict_based_search_status(start_time, num_expanded, len(open_list))
+            print('Maximum memory usage exceeded!', file=sys.stderr, flush=True)
+            return False, []
+        if time.time() - last_status_time >= 1:
+            print_conflict_based_search_status(start_time, num_expanded, len(open_list))
+            last_status_time = time.time()
+
+        _, _, node = heapq.heappop(open_list)
+        conflict = find_first_conflict([cells for (cells, _) in node.paths])
+        if conflict is None:
+            print_conflict_based_search_status(start_time, num_expanded, len(open_list))
+            return True, extract_joint_plan(node.paths)
+        num_expanded += 1
+
+        conflict_type, agent_index, other_agent_index, cell, conflict_time = conflict
+        if conflict_type == 'vertex':
+            branches = [(agent_index, cell, cell, conflict_time), (other_agent_index, cell, cell, conflict_time)]
+        else:
+            # The first agent moved into the cell at the conflict time, since it would otherwise have been in the
+            # cell together with the other agent at the previous time
+            previous_cell = node.paths[agent_index][0][conflict_time - 1]
+            branches = [(agent_index, previous_cell, cell, conflict_time),
+                        (other_agent_index, cell, cell, conflict_time - 1)]
+
+        for (constrained_agent_index, constraint_cell, constraint_new_cell, constraint_time) in branches:
+            constraints = list(node.constraints)
+            agent_constraints = constraints[constrained_agent_index].copy()
+            if constraint_cell == constraint_new_cell:
+                agent_constraints.add_vertex_constraint(constraint_new_cell, constraint_time)
+            else:
+                agent_constraints.add_edge_constraint(constraint_cell, constraint_new_cell, constraint_time)
+            constraints[constrained_agent_index] = agent_constraints
+
+            path = find_path(constrained_agent_index, agent_constraints)
+            if path is None:
+                continue
+            paths = list(node.paths)
+            paths[constrained_agent_index] = path
+            child = ConstraintTreeNode(constraints, paths)
+            heapq.heappush(open_list, (child.cost, -next(counter), child))
+
+    print_conflict_based_search_status(start_time, num_expanded, len(open_list))
+    return False, []
+
+
+def find_first_conflict(paths):
+    """
+    Returns the earliest conflict between the paths, given as the lists of cells of the agents, where every agent
+    stays in its last cell once its path has ended. A conflict is returned as a (type, agent index, other agent index,
+    cell, time) tuple, with the type 'vertex' or 'follow' (see conflict_based_search), or None if there is none.
+    """
+    plan_length = max(len(cells) for cells in paths)
+    previous_occupancy = {cells[0]: agent_index for (agent_index, cells) in enumerate(paths)}
+    for conflict_time in range(1, plan_length):
+        occupancy = {}
+        for (agent_index, cells) in enumerate(paths):
+            cell = cells[min(conflict_time, len(cells) - 1)]
+            other_agent_index = occupancy.get(cell)
+            if other_agent_index is not None:
+                return 'vertex', other_agent_index, agent_index, cell, conflict_time
+            occupancy[cell] = agent_index
+        for (agent_index, cells) in enumerate(paths):
+            cell = cells[min(conflict_time, len(cells) - 1)]
+            other_agent_index = previous_occupancy.get(cell)
+            if other_agent_index is not None and other_agent_index != agent_index:
+                return 'follow', agent_index, other_agent_index, cell, conflict_time
+        previous_occupancy = occupancy
+    return None
+
+
+def extract_joint_plan(paths):
+    """Combines the actions of the paths into a list of joint actions, where agents whose path has ended wait"""
+    plan_length = max(len(actions) for (_, actions) in paths)
+    wait_action = NoOpAction()
+    return [[actions[step] if step < len(actions) else wait_action for (_, actions) in paths]
+            for step in range(plan_length)]
+
+
+def print_conflict_based_search_status(start_time, num_expanded, num_open):
+    memory_usage_bytes = memory.get_usage()
+    # Replacing the generated comma thousands separators with dots is neither pretty nor locale aware but none of
+    # Pythons four different formatting facilities seems to handle this correctly!
+    num_expanded = f"{num_expanded:8,d}".replace(',', '.')
+    num_open = f"{num_open:8,d}".replace(',', '.')
+    elapsed_time = f"{time.time() - start_time:3.3f}".replace('.', ',')
+    memory_usage_mb = f"{memory_usage_bytes / (1024*1024):3.2f}".replace('.', ',')
+    status_text = f"#Expanded: {num_expanded}, #Constraint tree: {num_open}, Time: {elapsed_time} s," \
+                  f" Memory: {memory_usage_mb} MB"
+    print(status_text, file=sys.stderr)
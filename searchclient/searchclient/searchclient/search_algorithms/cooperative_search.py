@@ -0,0 +1,207 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import heapq
+import itertools
+import math
+import sys
+import time
+import memory
+from domains.hospital.level import NO_CELL
+from strategies.bestfirst import FrontierBestFirst
+from utils import GenericNoOp
+
+
+class ReservationTable:
+    """
+    The cells reserved by the plans of other agents over time, where time t is the time after the t'th joint action
+    has been performed. occupied holds the set of reserved cells at every time, and the cells reserved at the last time
+    stay reserved forever. last_times maps every reserved cell into the last time it is reserved, which is infinite
+    for the cells reserved forever.
+    In the hospital domain an object may only move into a cell which is free at the start of the action, so a plan
+    may neither enter a cell reserved at the time before, nor leave a cell which is reserved right after.
+    Only the cells of agents and the boxes they can move are reserved. Boxes of colors without agents never move, and
+    are instead kept in the states of all plans.
+    """
+
+    def __init__(self):
+        self.occupied = [set()]
+        self.last_times = {}
+        # The cells reserved at either the time before or the given time, by time, as used by allows
+        self._blocked = {}
+
+    @staticmethod
+    def movable_cells(state):
+        """Returns the cells of the agents of the state and of the boxes with the same colors as the agents"""
+        colors = state.level.colors
+        agent_colors = {colors[agent_char] for agent_char in state.agent_chars}
+        return [cell for (cell, idx) in state.occupancy().items()
+                if idx >= 0 or colors[state.box_chars[-1 - idx]] in agent_colors]
+
+    def occupied_at(self, time):
+        return self.occupied[min(time, len(self.occupied) - 1)]
+
+    def reserve_static(self, state):
+        """Reserves the cells of the objects of the state at all times, while the objects have no plan"""
+        self._blocked.clear()
+        for cell in self.movable_cells(state):
+            for occupied in self.occupied:
+                occupied.add(cell)
+            self.last_times[cell] = math.inf
+
+    def release_static(self, state):
+        """Releases the cells reserved by reserve_static, before a plan is found for the objects of the state"""
+        self._blocked.clear()
+        for cell in self.movable_cells(state):
+            for occupied in self.occupied:
+                occupied.discard(cell)
+            del self.last_times[cell]
+
+    def reserve_plan(self, state, plan):
+        """Reserves the cells of the objects of the state while the plan is executed, and their final cells forever"""
+        self._blocked.clear()
+        states = [state]
+        for joint_action in plan:
+            states.append(states[-1].result(joint_action))
+        while len(self.occupied) < len(states):
+            self.occupied.append(set(self.occupied[-1]))
+        for (step, plan_state) in enumerate(states):
+            cells = self.movable_cells(plan_state)
+            self.occupied[step].update(cells)
+            for cell in cells:
+                self.last_times[cell] = max(self.last_times.get(cell, -1), step)
+        final_cells = self.movable_cells(states[-1])
+        for later_occupied in self.occupied[len(states):]:
+            later_occupied.update(final_cells)
+        for cell in final_cells:
+            self.last_times[cell] = math.inf
+
+    def allows(self, cells, new_cells, time):
+        """Returns whether objects in the cells at the time before may end up in the new cells at the given time"""
+        time = min(time, len(self.occupied))
+        blocked = self._blocked.get(time)
+        if blocked is None:
+            blocked = self._blocked[time] = self.occupied_at(time - 1) | self.occupied_at(time)
+        return blocked.isdisjoint(cells) and blocked.isdisjoint(new_cells)
+
+    def horizon(self):
+        """
+        Returns the first time from which the reserved cells never change, neither at that time nor the time before
+        """
+        return len(self.occupied)
+
+
+def cooperative_search(initial_state, action_set, goal_description, frontier, reservation_table,
+                       protected_goals=None):
+    """
+    A space-time search for a plan which avoids the cells reserved by the reservation table, as in cooperative A*.
+    The search nodes are pairs of a state and the time, with the waiting joint action available in every state, and
+    the nodes are expanded in order of frontier.f if the frontier is a best-first frontier (where the path cost of a
+    state is its time), and in order of time otherwise. After the horizon of the reservation table, the reserved cells
+    never change, so all later times of a state are considered the same search node.
+    A plan ends in a goal state whose cells are not reserved at any later time, such that the agents can stay there.
+    Since the cells of the goal state are reserved forever afterwards, protected_goals may give the goals of the agents
+    planning later as a list of (agent cells, goal cells) pairs, and the plan must then end in a state which keeps every
+    such goal cell free and reachable from one of the agent cells (see keeps_goals_reachable).
+    Returns a (boolean, plan) pair just like graph_search.
+    """
+    start_time = time.time()
+    memory_guard = memory.MemoryGuard()
+    if isinstance(frontier, FrontierBestFirst):
+        frontier.prepare(goal_description)
+
+    initial_state.parent = None
+    initial_state.path_cost = 0
+    horizon = reservation_table.horizon()
+    wait_action = [GenericNoOp()] * len(initial_state.agent_chars)
+
+    def priority(state):
+        if isinstance(frontier, FrontierBestFirst):
+            return frontier.f(state, goal_description)
+        return state.path_cost
+
+    # The open list holds entries (priority, count, state), where ties are broken in LIFO order just like the
+    # PriorityQueue in bestfirst.py. The time of a state is its path cost.
+    counter = itertools.count()
+    open_list = [(priority(initial_state), 0, initial_state)]
+    seen = {(initial_state, 0)}
+    num_expanded = 0
+
+    while len(open_list) > 0:
+        if memory_guard.exceeded(len(seen)):
+            print_cooperative_search_status(start_time, num_expanded, len(open_list))
+            print('Maximum memory usage exceeded!', file=sys.stderr, flush=True)
+            return False, []
+
+        _, _, state = heapq.heappop(open_list)
+        state_time = state.path_cost
+        cells = state.occupancy().keys()
+        if goal_description.is_goal(state) and \
+                all(reservation_table.last_times.get(cell, -1) < state_time for cell in cells) and \
+                (protected_goals is None or keeps_goals_reachable(state.level, cells, protected_goals)):
+            print_cooperative_search_status(start_time, num_expanded, len(open_list))
+            return True, state.extract_plan()
+
+        num_expanded += 1
+        if num_expanded % 10000 == 0:
+            print_cooperative_search_status(start_time, num_expanded, len(open_list))
+
+        joint_actions = state.get_applicable_actions(action_set)
+        joint_actions.append(wait_action)
+        for joint_action in joint_actions:
+            child = state.result(joint_action)
+            node = (child, min(child.path_cost, horizon))
+            if node in seen or not reservation_table.allows(cells, child.occupancy().keys(), child.path_cost):
+                continue
+            seen.add(node)
+            heapq.heappush(open_list, (priority(child), -next(counter), child))
+
+    print_cooperative_search_status(start_time, num_expanded, len(open_list))
+    return False, []
+
+
+def keeps_goals_reachable(level, cells, protected_goals):
+    """
+    Returns whether objects staying in the given cells forever leave every goal cell of the protected goals, given as
+    (agent cells, goal cells) pairs, free and reachable from one of the agent cells, ignoring all other objects
+    """
+    blocked = set(cells)
+    for (agent_cells, goal_cells) in protected_goals:
+        if not blocked.isdisjoint(goal_cells):
+            return False
+        reached = {cell for cell in agent_cells if cell not in blocked}
+        queue = collections.deque(reached)
+        while len(queue) > 0:
+            current_cell = queue.popleft()
+            for neighbours in level.neighbours.values():
+                neighbour_cell = neighbours[current_cell]
+                if neighbour_cell != NO_CELL and neighbour_cell not in blocked and neighbour_cell not in reached:
+                    reached.add(neighbour_cell)
+                    queue.append(neighbour_cell)
+        if not reached.issuperset(goal_cells):
+            return False
+    return True
+
+
+def print_cooperative_search_status(start_time, num_expanded, num_open):
+    memory_usage_bytes = memory.get_usage()
+    # Replacing the generated comma thousands separators with dots is neither pretty nor locale aware but none of
+    # Pythons four different formatting facilities seems to handle this correctly!
+    num_expanded = f"{num_expanded:8,d}".replace(',', '.')
+    num_open = f"{num_open:8,d}".replace(',', '.')
+    elapsed_time = f"{time.time() - start_time:3.3f}".replace('.', ',')
+    memory_usage_mb = f"{memory_usage_bytes / (1024*1024):3.2f}".replace('.', ',')
+    status_text = f"#Expanded: {num_expanded}, #Frontier: {num_open}, Time: {elapsed_time} s," \
+                  f" Memory: {memory_usage_mb} MB"
+    print(status_text, file=sys.stderr)
@@ -0,0 +1,175 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import mmap
+import struct
+import tempfile
+
+# The number of bits per key and the number of hash functions of the Bloom filters, giving about 1% false positives
+BLOOM_BITS_PER_KEY = 10
+BLOOM_NUM_HASHES = 7
+# The runs are merged into a single run once there are more than this number of runs
+MAX_RUNS = 8
+
+# The joint action id stored for the initial state, whose record is None
+_NO_ACTION = 2 ** 64 - 1
+_action_struct = struct.Struct('=Q')
+
+
+class BloomFilter:
+    """A Bloom filter over byte strings, using double hashing of the built-in hash value to derive the bit indices"""
+
+    def __init__(self, num_keys):
+        self.num_bits = max(64, num_keys * BLOOM_BITS_PER_KEY)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _indices(self, key):
+        key_hash = hash(key) & 0xFFFFFFFFFFFFFFFF
+        first_hash = key_hash & 0xFFFFFFFF
+        second_hash = (key_hash >> 32) | 1
+        return ((first_hash + i * second_hash) % self.num_bits for i in range(BLOOM_NUM_HASHES))
+
+    def add(self, key):
+        for index in self._indices(key):
+            self.bits[index >> 3] |= 1 << (index & 7)
+
+    def __contains__(self, key):
+        for index in self._indices(key):
+            if not self.bits[index >> 3] & (1 << (index & 7)):
+                return False
+        return True
+
+
+class SortedRun:
+    """
+    A run of records sorted by key, stored in an anonymous temporary file in the given directory and memory-mapped for
+    lookups. Every record is the key followed by the record value (see DiskClosedTable), with a fixed size.
+    The records are written as they are iterated, so a run can be built from other runs without loading them.
+    """
+
+    def __init__(self, directory, key_size, records, num_records):
+        self.key_size = key_size
+        self.record_size = 2 * key_size + _action_struct.size
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.num_records = num_records
+        self.bloom_filter = BloomFilter(num_records)
+        for record in records:
+            self.file.write(record)
+            self.bloom_filter.add(record[:key_size])
+        self.file.flush()
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.num_records > 0 else None
+
+    def records(self):
+        for offset in range(0, self.num_records * self.record_size, self.record_size):
+            yield self.map[offset:offset + self.record_size]
+
+    def find(self, key):
+        """Returns the record with the key, or None if the run does not contain the key"""
+        if key not in self.bloom_filter:
+            return None
+        # Binary search over the records, comparing the keys directly in the memory map
+        low, high = 0, self.num_records
+        while low < high:
+            middle = (low + high) // 2
+            offset = middle * self.record_size
+            middle_key = self.map[offset:offset + self.key_size]
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return self.map[offset:offset + self.record_size]
+        return None
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+class DiskClosedTable:
+    """
+    A closed table for closed_table_graph_search, mapping the compact key of every generated state to its record
+    (predecessor key, joint action id), or None for the initial state, which spills to disk when asked to (see spill).
+    New records are kept in a dictionary in memory. A spill writes them to a new run on disk, sorted by key and
+    memory-mapped, with a Bloom filter in memory in front of it, such that most lookups of keys which are not in the
+    run never touch the disk. Once there are more than MAX_RUNS runs, they are merged into a single run.
+    All keys must have the same size, which holds for the keys of the states of a single search.
+    """
+
+    def __init__(self, directory, key_size):
+        self.directory = directory
+        self.key_size = key_size
+        self.in_memory = {}
+        self.runs = []
+        self.num_spilled = 0
+
+    def __len__(self):
+        return len(self.in_memory) + self.num_spilled
+
+    def __contains__(self, key):
+        if key in self.in_memory:
+            return True
+        return any(run.find(key) is not None for run in self.runs)
+
+    def __getitem__(self, key):
+        if key in self.in_memory:
+            return self.in_memory[key]
+        for run in self.runs:
+            record = run.find(key)
+            if record is not None:
+                return self._decode(record)
+        raise KeyError(key)
+
+    def __setitem__(self, key, record):
+        self.in_memory[key] = record
+
+    def _encode(self, key, record):
+        if record is None:
+            return key + bytes(self.key_size) + _action_struct.pack(_NO_ACTION)
+        predecessor_key, joint_action_id = record
+        return key + predecessor_key + _action_struct.pack(joint_action_id)
+
+    def _decode(self, record):
+        joint_action_id, = _action_struct.unpack_from(record, 2 * self.key_size)
+        if joint_action_id == _NO_ACTION:
+            return None
+        return record[self.key_size:2 * self.key_size], joint_action_id
+
+    def spill(self):
+        """Writes the records in memory to a new sorted run on disk, merging all runs if there are too many"""
+        # The records are encoded while they are written, since memory is short when the table spills
+        num_records = len(self.in_memory)
+        records = (self._encode(key, self.in_memory[key]) for key in sorted(self.in_memory))
+        self.runs.append(SortedRun(self.directory, self.key_size, records, num_records))
+        self.num_spilled += num_records
+        self.in_memory.clear()
+
+        if len(self.runs) > MAX_RUNS:
+            # No key is in more than one run, so merging the sorted records yields the records sorted by key
+            merged_run = SortedRun(self.directory, self.key_size, heapq.merge(*[run.records() for run in self.runs]),
+                                   self.num_spilled)
+            for run in self.runs:
+                run.close()
+            self.runs = [merged_run]
+
+    def bloom_filter_size(self):
+        """Returns the number of bytes taken by the Bloom filters of the runs, which are kept in memory"""
+        return sum(len(run.bloom_filter.bits) for run in self.runs)
+
+    def close(self):
+        """Removes the runs from disk"""
+        for run in self.runs:
+            run.close()
+        self.runs = []
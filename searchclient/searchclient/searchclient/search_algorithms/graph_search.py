@@ -11,14 +11,62 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import math
 import sys
 import time
 import memory
 from domains.hospital.actions import *
+from domains.hospital.heuristics import HeuristicCache
+from search_algorithms.bidirectional_search import bidirectional_a_star_search, bidirectional_search, \
+    can_search_bidirectionally
+from search_algorithms.disk_closed_table import DiskClosedTable
+from search_algorithms.parallel_search import parallel_best_first_search
+from strategies.arastar import FrontierARAStar
+from strategies.bestfirst import FrontierAStar, FrontierBestFirst
+from strategies.bfs import FrontierBFS
+from strategies.idastar import FrontierIDAStar
+from utils import JointActionEncoder
+
+# When enabled, graph_search keeps a closed table instead of the search tree (see closed_table_graph_search).
+# The searchclient sets this from the command line.
+use_closed_table = False
+# When enabled, breadth-first and A* searches on single-agent levels where the goal places all boxes search from both
+# ends (see bidirectional_search and bidirectional_a_star_search). The searchclient sets this from the command line.
+use_bidirectional = False
+# When set, closed_table_graph_search spills its closed table to this directory instead of stopping when the memory
+# usage exceeds the limit (see DiskClosedTable). The searchclient sets this from the command line.
+spill_directory = None
+# The fewest records the closed table must be able to hold in memory for spilling to be worthwhile
+MIN_SPILL_RECORDS = 10000
+# A state in the frontier takes about as much memory as this number of closed table records
+FRONTIER_STATE_RECORDS = 4
+# When above 1, best-first searches are distributed over this number of worker processes
+# (see parallel_best_first_search). The searchclient sets this from the command line.
+num_workers = 1
 
 
 def graph_search(initial_state, action_set, goal_description, frontier):
     global start_time
+
+    if use_bidirectional:
+        if not isinstance(frontier, (FrontierBFS, FrontierAStar)):
+            print('Bidirectional search is only supported for BFS and A*, searching forward only.', file=sys.stderr,
+                  flush=True)
+        elif not can_search_bidirectionally(initial_state, action_set, goal_description):
+            print('Bidirectional search requires a single agent and a goal placing every box, searching forward only.',
+                  file=sys.stderr, flush=True)
+        elif isinstance(frontier, FrontierBFS):
+            return bidirectional_search(initial_state, action_set, goal_description)
+        else:
+            return bidirectional_a_star_search(initial_state, action_set, goal_description, frontier.heuristic)
+    if isinstance(frontier, FrontierARAStar):
+        return anytime_search(initial_state, action_set, goal_description, frontier)
+    if num_workers > 1 and isinstance(frontier, FrontierBestFirst):
+        return parallel_best_first_search(initial_state, action_set, goal_description, frontier, num_workers)
+    if isinstance(frontier, FrontierIDAStar):
+        return ida_star_search(initial_state, action_set, goal_description, frontier)
+    if use_closed_table or frontier.stores_keys:
+        return closed_table_graph_search(initial_state, action_set, goal_description, frontier)
     
     # Set start time
     start_time = time.time()
@@ -61,17 +109,23 @@ def graph_search(initial_state, action_set, goal_description, frontier):
             [MoveAction("S")],
             [MoveAction("S")],
         ]
+    # With an early goal test, every state is tested when it is generated (see frontier.early_goal_test)
+    early_goal_test = frontier.early_goal_test
+    if early_goal_test and goal_description.is_goal(initial_state):
+        return True, []
+
     frontier.add(initial_state)
     expanded = set()
+    memory_guard = memory.MemoryGuard()
 
     while True:
         
         # Print a progress status message every 10000 iterations
         if iterations % 10000 == 0 and iterations != 0:
-            print_search_status(expanded, frontier)
+            print_search_status(len(expanded), frontier)
 
         # Ensure that we do not use more memory than allowed
-        if memory.get_usage() > memory.max_usage:
+        if memory_guard.exceeded(len(expanded) + frontier.size()):
             print('Maximum memory usage exceeded!', file=sys.stderr, flush=True)
             sys.exit(-1)
   
@@ -91,37 +145,329 @@ def graph_search(initial_state, action_set, goal_description, frontier):
         
         # finds applicable actions in current state, and loops through these
         actions = state.get_applicable_actions(action_set)
+        # the new states are added to the frontier together, such that their heuristic values can be evaluated at once.
+        # The dictionary is used as an ordered set, since two actions may lead to the same state.
+        new_states = {}
 
         for action in actions:
             # finds new state based on applicable action
             new_state = state.result(action)
             # checks if new state has been visited before or is in frontier
-            if ((new_state not in expanded) and (not frontier.contains(new_state))):
+            if ((new_state not in expanded) and (not frontier.contains(new_state)) and (new_state not in new_states)):
+                # if the new state is a goal and goals are tested early, the search can stop right away
+                if early_goal_test and goal_description.is_goal(new_state):
+                    print_search_status(len(expanded), frontier)
+                    return True, new_state.extract_plan()
                 # if not, new state is added to frontier
-                frontier.add(new_state)
+                new_states[new_state] = None
+        frontier.add_all(list(new_states))
 
         iterations += 1
 
         # if state is goal, return True along with route to goal
         if goal_description.is_goal(state): 
-            print_search_status(expanded, frontier)
+            print_search_status(len(expanded), frontier)
             return True, state.extract_plan()
 
+
+def closed_table_graph_search(initial_state, action_set, goal_description, frontier):
+    """
+    A variant of graph_search which does not keep the search tree alive through the parent pointers of the states.
+    Instead, the closed table maps the compact key (see state.key) of every generated state to a record
+    (predecessor key, joint action id), or None for the initial state. The full states only exist while they are in
+    the frontier, and the plan is rebuilt from the records once a goal state is found. Frontiers which only store the
+    keys of the states (see FrontierBFS) are always searched this way, and then not even the frontier holds states.
+    If a spill directory is set, the closed table is spilled to disk when the memory usage exceeds the limit. Since
+    the memory freed by a spill is kept by the process for the records and states added afterwards, the usage does not
+    drop after a spill. Therefore, the memory available is measured in records from then on, counting every state in
+    the frontier as FRONTIER_STATE_RECORDS records and the Bloom filters of the table by their size, and the table
+    spills whenever the records in memory fill the memory which the frontier and the filters leave. The actual usage is
+    still sampled after every spill and at the sample interval, and whenever it has grown beyond the highest usage
+    seen, e.g. because the frontier takes more memory than estimated, the capacity is lowered by the growth. The search
+    only stops if fewer than MIN_SPILL_RECORDS records fit in memory.
+    """
+    global start_time
+
+    # Set start time
+    start_time = time.time()
+    iterations = 0
+    frontier.prepare(goal_description)
+    joint_action_encoder = JointActionEncoder(action_set)
+
+    initial_state.parent = None
+    initial_state.path_cost = 0
+
+    # Since the closed table contains both the expanded states and the states in the frontier, it is the only
+    # structure needed for duplicate detection
+    early_goal_test = frontier.early_goal_test
+    if early_goal_test and goal_description.is_goal(initial_state):
+        return True, []
+
+    if spill_directory is None:
+        closed_table = {initial_state.key(): None}
+    else:
+        closed_table = DiskClosedTable(spill_directory, len(initial_state.key()))
+        closed_table[initial_state.key()] = None
+    # The runs of a disk closed table are removed however the search ends, including when it exits the process
+    try:
+        frontier.add(initial_state)
+        # The pages of the runs on disk which are read through their memory maps can be reclaimed by the operating
+        # system, so they do not count towards the memory usage
+        memory_guard = memory.MemoryGuard(memory.get_usage if spill_directory is None else memory.get_anonymous_usage)
+        # The memory available to the closed table, the frontier and the Bloom filters, in records, once the limit has
+        # been reached, the estimated size of a record in bytes, and the highest actual usage sampled since then
+        memory_capacity = None
+        bytes_per_record = None
+        peak_usage = None
+        spilled = False
+
+        while True:
+
+            # Print a progress status message every 10000 iterations
+            if iterations % 10000 == 0 and iterations != 0:
+                print_search_status(iterations, frontier)
+
+            # Ensure that we do not use more memory than allowed, spilling the closed table to disk if possible
+            if spill_directory is not None:
+                num_records = len(closed_table.in_memory) + FRONTIER_STATE_RECORDS * frontier.size()
+                if memory_capacity is None:
+                    if memory_guard.exceeded(len(closed_table.in_memory) + frontier.size()):
+                        # The whole usage is attributed to the records, which overestimates their size, and the
+                        # records exceeding the limit are taken out of the capacity
+                        peak_usage = memory_guard.last_usage
+                        bytes_per_record = peak_usage / num_records
+                        memory_capacity = num_records - (peak_usage - memory.max_usage) / bytes_per_record
+                elif spilled or time.time() - memory_guard.last_sample_time >= memory.sample_interval_seconds:
+                    usage = memory_guard.sample(len(closed_table.in_memory) + frontier.size())
+                    if usage > peak_usage:
+                        memory_capacity -= (usage - peak_usage) / bytes_per_record
+                        peak_usage = usage
+                spilled = False
+                if memory_capacity is not None:
+                    available_records = memory_capacity - closed_table.bloom_filter_size() / bytes_per_record
+                    if num_records >= available_records:
+                        if available_records - FRONTIER_STATE_RECORDS * frontier.size() < MIN_SPILL_RECORDS:
+                            print('Maximum memory usage exceeded!', file=sys.stderr, flush=True)
+                            sys.exit(-1)
+                        closed_table.spill()
+                        spilled = True
+                        num_table_records = f"{len(closed_table):,d}".replace(',', '.')
+                        print(f"Spilled the closed table to disk, {num_table_records} records in total",
+                              file=sys.stderr, flush=True)
+            elif memory_guard.exceeded(len(closed_table)):
+                print('Maximum memory usage exceeded!', file=sys.stderr, flush=True)
+                sys.exit(-1)
+
+            if frontier.is_empty():
+                return False, []
+
+            state = frontier.pop()
+            state_key = state.key()
+            # The new states are added to the frontier together, so their heuristic values are evaluated at once
+            new_states = []
+
+            for action in state.get_applicable_actions(action_set):
+                new_state = state.result(action)
+                new_state_key = new_state.key()
+                if new_state_key not in closed_table:
+                    closed_table[new_state_key] = (state_key, joint_action_encoder.encode(action))
+                    if early_goal_test and goal_description.is_goal(new_state):
+                        print_search_status(iterations, frontier)
+                        return True, extract_plan_from_closed_table(closed_table, new_state_key, joint_action_encoder)
+                    # The closed table remembers how the state was reached, so the search tree pointers can be dropped
+                    new_state.parent = None
+                    new_state.action = None
+                    new_states.append(new_state)
+            frontier.add_all(new_states)
+
+            iterations += 1
+
+            if goal_description.is_goal(state):
+                print_search_status(iterations, frontier)
+                return True, extract_plan_from_closed_table(closed_table, state_key, joint_action_encoder)
+    finally:
+        if spill_directory is not None:
+            closed_table.close()
+
+
+def ida_star_search(initial_state, action_set, goal_description, frontier):
+    """
+    Iterative-deepening A* (R&N section 3.5.4). Every iteration is a depth-first search which prunes all states whose
+    f value exceeds the cost bound, and the next iteration uses the lowest f value pruned as its cost bound.
+    Only the current path is kept (see FrontierIDAStar), so the memory usage is linear in the plan length.
+    """
+    global start_time
+
+    # Set start time
+    start_time = time.time()
+    iterations = 0
+    frontier.prepare(goal_description)
+    memory_guard = memory.MemoryGuard()
+
+    initial_state.parent = None
+    initial_state.path_cost = 0
+    bound = frontier.f(initial_state)
+
+    while True:
+        # The lowest f value of any state pruned in this iteration
+        next_bound = math.inf
+        frontier.start_iteration(initial_state)
+
+        while not frontier.is_empty():
+            state, children = frontier.top()
+
+            if children is None:
+                if goal_description.is_goal(state):
+                    print_search_status(iterations, frontier)
+                    return True, state.extract_plan()
+
+                # Print a progress status message every 10000 iterations
+                if iterations % 10000 == 0 and iterations != 0:
+                    print_search_status(iterations, frontier)
+
+                # Ensure that we do not use more memory than allowed
+                if memory_guard.exceeded(frontier.num_stored()):
+                    print('Maximum memory usage exceeded!', file=sys.stderr, flush=True)
+                    sys.exit(-1)
+
+                # The children are generated one at a time, when the search returns to the state. The bound method
+                # state.result fixes the parent now, rather than whenever the next child is generated.
+                children = map(state.result, state.get_applicable_actions(action_set))
+                frontier.set_children(children)
+                iterations += 1
+
+            child = next(children, None)
+            if child is None:
+                frontier.pop()
+                continue
+
+            f = frontier.f(child)
+            if f > bound:
+                next_bound = min(next_bound, f)
+            elif frontier.admit(child):
+                frontier.push(child)
+
+        # If no state was pruned, the whole state space has been searched without finding a goal
+        if next_bound == math.inf:
+            return False, []
+        bound = next_bound
+        print(f"Increasing the cost bound to {bound}", file=sys.stderr, flush=True)
+
+
+def anytime_search(initial_state, action_set, goal_description, frontier):
+    """
+    Anytime repairing A* (ARA*, Likhachev et al. 2003). A weighted A* search quickly finds a first plan, after which the
+    weight is lowered and the search continues from where it stopped to find cheaper plans, until the weight reaches
+    1 or the time budget is used up (see FrontierARAStar). Closed states which are reached by a cheaper path are not
+    reopened during a search, but kept as inconsistent states and added to the frontier when the weight is lowered.
+    The time budget is measured from the start of the search, but the search never stops before the first plan has been
+    found, and the cheapest plan found is returned.
+    """
+    global start_time
+
+    # Set start time
+    start_time = time.time()
+    deadline = start_time + frontier.time_budget
+    iterations = 0
+    frontier.prepare(goal_description)
+    memory_guard = memory.MemoryGuard()
+
+    initial_state.parent = None
+    initial_state.path_cost = 0
+
+    # The cheapest known state equal to each generated state, i.e. the one reached with the lowest path cost
+    best_states = {initial_state: initial_state}
+    expanded = set()
+    # The number of states expanded over all the searches, while expanded only holds those of the current search
+    num_expanded = 0
+    inconsistent_states = {}
+    # The goal state of the cheapest plan found so far
+    best_goal_state = initial_state if goal_description.is_goal(initial_state) else None
+    frontier.add(initial_state)
+
+    while True:
+        # Search until no state in the frontier can lead to a cheaper plan for the current weight
+        while not frontier.is_empty():
+            if best_goal_state is not None and \
+                    (frontier.min_f() >= best_goal_state.path_cost or time.time() > deadline):
+                break
+
+            # Print a progress status message every 10000 iterations
+            if iterations % 10000 == 0 and iterations != 0:
+                print_search_status(num_expanded, frontier)
+
+            # Ensure that we do not use more memory than allowed
+            if memory_guard.exceeded(len(best_states)):
+                print('Maximum memory usage exceeded!', file=sys.stderr, flush=True)
+                sys.exit(-1)
+
+            state = frontier.pop()
+            expanded.add(state)
+            num_expanded += 1
+            iterations += 1
+
+            for action in state.get_applicable_actions(action_set):
+                new_state = state.result(action)
+                best_state = best_states.get(new_state)
+                if best_state is not None and best_state.path_cost <= new_state.path_cost:
+                    continue
+                best_states[new_state] = new_state
+                if goal_description.is_goal(new_state) and \
+                        (best_goal_state is None or new_state.path_cost < best_goal_state.path_cost):
+                    best_goal_state = new_state
+                if new_state in expanded:
+                    inconsistent_states[new_state] = new_state
+                else:
+                    frontier.update(new_state)
+
+        if best_goal_state is None:
+            # The whole state space has been searched without finding a goal
+            return False, []
+
+        print(f"Found plan of length {best_goal_state.path_cost} with weight {frontier.weight}", file=sys.stderr,
+              flush=True)
+        if frontier.weight <= 1 or time.time() > deadline or (frontier.is_empty() and len(inconsistent_states) == 0):
+            print_search_status(num_expanded, frontier)
+            return True, best_goal_state.extract_plan()
+
+        frontier.lower_weight(inconsistent_states.values())
+        inconsistent_states.clear()
+        expanded.clear()
+
+
+def extract_plan_from_closed_table(closed_table, state_key, joint_action_encoder):
+    """Extracts a plan by walking backwards through the records of the closed table"""
+    reverse_plan = []
+    record = closed_table[state_key]
+    while record is not None:
+        predecessor_key, joint_action_id = record
+        reverse_plan.append(joint_action_encoder.decode(joint_action_id))
+        record = closed_table[predecessor_key]
+    reverse_plan.reverse()
+    return reverse_plan
+
+
 # A global variable used to keep track of the start time of the current search
 start_time = 0
 
-def print_search_status(expanded, frontier):
+def print_search_status(num_expanded, frontier):
     global start_time
-    if len(expanded) == 0:
+    if num_expanded == 0:
         start_time = time.time()
     memory_usage_bytes = memory.get_usage()
+    num_generated = num_expanded + frontier.size()
     # Replacing the generated comma thousands separators with dots is neither pretty nor locale aware but none of
     # Pythons four different formatting facilities seems to handle this correctly!
-    num_expanded = f"{len(expanded):8,d}".replace(',', '.')
+    num_expanded = f"{num_expanded:8,d}".replace(',', '.')
     num_frontier = f"{frontier.size():8,d}".replace(',', '.')
-    num_generated = f"{len(expanded) + frontier.size():8,d}".replace(',', '.')
+    num_generated = f"{num_generated:8,d}".replace(',', '.')
     elapsed_time = f"{time.time() - start_time:3.3f}".replace('.', ',')
     memory_usage_mb = f"{memory_usage_bytes / (1024*1024):3.2f}".replace('.', ',')
     status_text = f"#Expanded: {num_expanded}, #Frontier: {num_frontier}, #Generated: {num_generated}," \
                   f" Time: {elapsed_time} s, Memory: {memory_usage_mb} MB"
+    heuristic = getattr(frontier, 'heuristic', None)
+    if isinstance(heuristic, HeuristicCache):
+        cache_hits = f"{heuristic.hits:,d}".replace(',', '.')
+        cache_misses = f"{heuristic.misses:,d}".replace(',', '.')
+        status_text += f", Cache hits: {cache_hits}, Cache misses: {cache_misses}"
     print(status_text, file=sys.stderr)
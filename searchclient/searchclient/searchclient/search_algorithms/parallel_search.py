@@ -0,0 +1,283 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import itertools
+import math
+import multiprocessing
+import queue
+import sys
+import time
+import memory
+from strategies.bestfirst import FrontierAStar
+from utils import JointActionEncoder
+
+# The number of states a worker expands before it sends the generated children to their owners and reads its inbox
+EXPANSIONS_PER_ROUND = 100
+# The number of seconds the coordinator waits for a worker to reply while the plan is extracted
+REPLY_TIMEOUT = 10
+
+
+def parallel_best_first_search(initial_state, action_set, goal_description, frontier, num_workers):
+    """
+    A hash distributed best-first search (HDA*), where every state is owned by one of the worker processes, namely
+    worker hash(state) % num_workers. Each worker keeps the open list and the closed table of the states it owns, and
+    the children it generates are sent in batches to their owners. The states are sent as compact records
+    (key, path cost, predecessor key, joint action id), such that the search tree is spread over the closed tables
+    of the workers, from which the plan is rebuilt once the search has terminated.
+    The priorities are computed by frontier.f, so any FrontierBestFirst can be used. With A*, a goal state only gives
+    an upper bound on the plan cost, since the workers do not expand the states in the global order of their f values.
+    The search therefore continues until no worker holds a state with an f value below the cost of the best plan found
+    and no records are in transit, which is detected from the number of records sent and received (see is_terminated).
+    With other strategies, the search stops at the first goal state.
+    If a worker exceeds its memory share, or a worker process dies, e.g. because it raised an exception, the remaining
+    workers are terminated and the search fails.
+    """
+    start_time = time.time()
+    initial_state.parent = None
+    initial_state.path_cost = 0
+    joint_action_encoder = JointActionEncoder(action_set)
+    wait_for_optimal_plan = isinstance(frontier, FrontierAStar)
+
+    inboxes = [multiprocessing.Queue() for _ in range(num_workers)]
+    replies = multiprocessing.Queue()
+    shared = SharedSearchState(num_workers)
+    workers = [multiprocessing.Process(target=search_worker,
+                                       args=(worker_index, num_workers, initial_state, action_set, goal_description,
+                                             frontier, inboxes, replies, shared, memory.max_usage / num_workers),
+                                       daemon=True)
+               for worker_index in range(num_workers)]
+    for worker in workers:
+        worker.start()
+
+    # The initial state is sent to its owner just like any other state
+    with shared.sent.get_lock():
+        shared.sent.value += 1
+    inboxes[hash(initial_state) % num_workers].put(('states', [(initial_state.key(), 0, None, None)]))
+
+    last_status_time = time.time()
+    while True:
+        time.sleep(0.01)
+
+        if shared.memory_exceeded.value:
+            terminate_workers(workers)
+            print('Maximum memory usage exceeded!', file=sys.stderr, flush=True)
+            return False, []
+        # The records of a dead worker are never counted as received, so the search could otherwise never terminate
+        if any(not worker.is_alive() for worker in workers):
+            terminate_workers(workers)
+            print('A search worker stopped unexpectedly!', file=sys.stderr, flush=True)
+            return False, []
+
+        if shared.goal_owner.value >= 0 and not wait_for_optimal_plan:
+            break
+        if shared.is_terminated():
+            break
+
+        # Print a progress status message every second
+        if time.time() - last_status_time >= 1:
+            print_parallel_search_status(start_time, shared)
+            last_status_time = time.time()
+
+    shared.done.value = True
+    print_parallel_search_status(start_time, shared)
+
+    plan = None
+    goal_owner = shared.goal_owner.value
+    if goal_owner >= 0:
+        # The goal key is only known by its owner, while the records of its predecessors are spread over all workers
+        inboxes[goal_owner].put(('goal',))
+        try:
+            state_key = replies.get(timeout=REPLY_TIMEOUT)
+            reverse_plan = []
+            while True:
+                inboxes[hash(initial_state.state_of_key(state_key)) % num_workers].put(('record', state_key))
+                predecessor_key, joint_action_id = replies.get(timeout=REPLY_TIMEOUT)
+                if predecessor_key is None:
+                    break
+                reverse_plan.append(joint_action_encoder.decode(joint_action_id))
+                state_key = predecessor_key
+        except queue.Empty:
+            terminate_workers(workers)
+            print('A search worker did not reply while extracting the plan!', file=sys.stderr, flush=True)
+            return False, []
+        reverse_plan.reverse()
+        plan = reverse_plan
+
+    for inbox in inboxes:
+        inbox.put(('stop',))
+    for worker in workers:
+        worker.join()
+
+    if plan is None:
+        return False, []
+    return True, plan
+
+
+def terminate_workers(workers):
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join()
+
+
+class SharedSearchState:
+    """
+    The values shared between the search workers and the process coordinating them:
+    - sent and received count the state records sent to and received by the workers, and idle tells for each worker
+      whether it has run out of states worth expanding. They are used to detect termination (see is_terminated).
+    - best_cost is the cost of the best plan found so far, and goal_owner is the index of the worker which owns its
+      goal state, or -1 if no plan has been found.
+    - expanded counts the states expanded by each worker, and generated the records sent to the workers.
+    - done tells the workers to stop expanding, and memory_exceeded is set by a worker exceeding its memory share.
+    """
+
+    def __init__(self, num_workers):
+        self.sent = multiprocessing.Value('q', 0)
+        self.received = multiprocessing.Value('q', 0)
+        self.idle = multiprocessing.Array('b', num_workers)
+        self.best_cost = multiprocessing.Value('d', math.inf)
+        self.goal_owner = multiprocessing.Value('i', -1)
+        self.expanded = multiprocessing.Array('q', num_workers)
+        self.done = multiprocessing.Value('b', False)
+        self.memory_exceeded = multiprocessing.Value('b', False)
+
+    def is_terminated(self):
+        """
+        Returns True iff all workers are idle and no records are in transit. A worker marks itself busy before it
+        counts the records it receives, so a worker which became busy after being seen idle must have had records in
+        transit, which shows up as a difference between sent and received or as a change of the counts.
+        """
+        sent, received = self.sent.value, self.received.value
+        if sent != received or not all(self.idle):
+            return False
+        return self.sent.value == sent and self.received.value == received
+
+
+def search_worker(worker_index, num_workers, initial_state, action_set, goal_description, frontier, inboxes, replies,
+                  shared, max_usage):
+    """The search loop of a single worker process (see parallel_best_first_search)"""
+    memory.max_usage = max_usage
+    memory_guard = memory.MemoryGuard()
+    frontier.prepare(goal_description)
+    joint_action_encoder = JointActionEncoder(action_set)
+    inbox = inboxes[worker_index]
+
+    # The open list holds entries (f, -count, path cost, key), where the count breaks ties in LIFO order just like the
+    # PriorityQueue in bestfirst.py. An entry is stale if a lower path cost to its state has been found since.
+    open_list = []
+    counter = itertools.count()
+    # The closed table maps the key of every state owned by the worker to (path cost, predecessor key, joint action id)
+    closed_table = {}
+    goal_key = None
+    num_expanded = 0
+
+    def receive(records):
+        for (key, path_cost, predecessor_key, joint_action_id) in records:
+            entry = closed_table.get(key)
+            if entry is not None and entry[0] <= path_cost:
+                continue
+            closed_table[key] = (path_cost, predecessor_key, joint_action_id)
+            state = initial_state.state_of_key(key)
+            state.path_cost = path_cost
+            heapq.heappush(open_list, (frontier.f(state, goal_description), -next(counter), path_cost, key))
+
+    while True:
+        # Read all messages in the inbox, waiting for one if there is nothing else to do
+        block = shared.idle[worker_index] or shared.done.value
+        while True:
+            try:
+                message = inbox.get(timeout=0.01) if block else inbox.get_nowait()
+            except queue.Empty:
+                break
+            block = False
+            if message[0] == 'states':
+                shared.idle[worker_index] = False
+                with shared.received.get_lock():
+                    shared.received.value += len(message[1])
+                if not shared.done.value:
+                    receive(message[1])
+            elif message[0] == 'goal':
+                replies.put(goal_key)
+            elif message[0] == 'record':
+                _, predecessor_key, joint_action_id = closed_table[message[1]]
+                replies.put((predecessor_key, joint_action_id))
+            elif message[0] == 'stop':
+                # Records sent after the search has stopped are never read, so they must not keep the worker alive
+                for other_inbox in inboxes:
+                    other_inbox.cancel_join_thread()
+                return
+
+        if shared.done.value:
+            shared.idle[worker_index] = True
+            continue
+
+        if memory_guard.exceeded(len(closed_table)):
+            shared.memory_exceeded.value = True
+            shared.idle[worker_index] = True
+            continue
+
+        outboxes = [[] for _ in range(num_workers)]
+        for _ in range(EXPANSIONS_PER_ROUND):
+            if len(open_list) == 0:
+                break
+            f, _, path_cost, key = open_list[0]
+            # States which cannot lead to a cheaper plan than the best one found are never expanded
+            if f >= shared.best_cost.value:
+                break
+            heapq.heappop(open_list)
+            if closed_table[key][0] != path_cost:
+                continue
+
+            state = initial_state.state_of_key(key)
+            state.path_cost = path_cost
+            num_expanded += 1
+
+            if goal_description.is_goal(state):
+                with shared.best_cost.get_lock():
+                    if path_cost < shared.best_cost.value:
+                        shared.best_cost.value = path_cost
+                        shared.goal_owner.value = worker_index
+                        goal_key = key
+                continue
+
+            for joint_action in state.get_applicable_actions(action_set):
+                child = state.result(joint_action)
+                record = (child.key(), path_cost + 1, key, joint_action_encoder.encode(joint_action))
+                outboxes[hash(child) % num_workers].append(record)
+
+        shared.expanded[worker_index] = num_expanded
+
+        # The children owned by the worker itself are received directly, the others are sent to their owners
+        receive(outboxes[worker_index])
+        for (owner, records) in enumerate(outboxes):
+            if owner != worker_index and len(records) > 0:
+                with shared.sent.get_lock():
+                    shared.sent.value += len(records)
+                inboxes[owner].put(('states', records))
+
+        # The worker is idle if it holds no state with an f value below the cost of the best plan found
+        shared.idle[worker_index] = len(open_list) == 0 or open_list[0][0] >= shared.best_cost.value
+
+
+def print_parallel_search_status(start_time, shared):
+    memory_usage_bytes = memory.get_usage()
+    # Replacing the generated comma thousands separators with dots is neither pretty nor locale aware but none of
+    # Pythons four different formatting facilities seems to handle this correctly!
+    num_expanded = f"{sum(shared.expanded):8,d}".replace(',', '.')
+    num_generated = f"{shared.sent.value:8,d}".replace(',', '.')
+    elapsed_time = f"{time.time() - start_time:3.3f}".replace('.', ',')
+    memory_usage_mb = f"{memory_usage_bytes / (1024*1024):3.2f}".replace('.', ',')
+    status_text = f"#Expanded: {num_expanded}, #Sent: {num_generated}, Workers: {len(shared.expanded)}," \
+                  f" Time: {elapsed_time} s, Memory: {memory_usage_mb} MB"
+    print(status_text, file=sys.stderr)
@@ -0,0 +1,133 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import itertools
+from domains.hospital.actions import NoOpAction, MoveAction
+from domains.hospital.level import NO_CELL
+
+
+class SpaceTimeConstraints:
+    """
+    The constraints on the path of a single agent moving through the level over time, where time t is the time after
+    the t'th joint action has been performed:
+    - vertex_constraints maps a cell id into the set of times at which the agent may not be in the cell.
+    - edge_constraints holds (cell, new cell, time) triplets, each forbidding the agent to move from the cell into the
+      new cell by the action ending at the given time.
+    - max_time is the latest time of any constraint. The constraints are the same at all later times.
+    """
+
+    def __init__(self):
+        self.vertex_constraints = {}
+        self.edge_constraints = set()
+        self.max_time = 0
+
+    def copy(self):
+        constraints = SpaceTimeConstraints()
+        constraints.vertex_constraints = {cell: set(times) for (cell, times) in self.vertex_constraints.items()}
+        constraints.edge_constraints = set(self.edge_constraints)
+        constraints.max_time = self.max_time
+        return constraints
+
+    def add_vertex_constraint(self, cell, time):
+        self.vertex_constraints.setdefault(cell, set()).add(time)
+        self.max_time = max(self.max_time, time)
+
+    def add_edge_constraint(self, cell, new_cell, time):
+        self.edge_constraints.add((cell, new_cell, time))
+        self.max_time = max(self.max_time, time)
+
+    def allows(self, cell, new_cell, time):
+        """Returns whether the agent may move from the cell into the new cell by the action ending at the given time"""
+        times = self.vertex_constraints.get(new_cell)
+        if times is not None and time in times:
+            return False
+        return (cell, new_cell, time) not in self.edge_constraints
+
+    def last_time(self, cell):
+        """Returns the latest time at which the agent may not be in the cell, or -1 if there is no such time"""
+        times = self.vertex_constraints.get(cell)
+        return max(times) if times else -1
+
+
+def space_time_search(level, action_library, start_cell, goal_cell, constraints):
+    """
+    Finds the shortest path of a single agent from the start cell to the goal cell which satisfies the constraints,
+    using A* on (cell, time) pairs with the true distance to the goal cell as heuristic (see level.distances_from).
+    The agent performs the Move and NoOp actions of the action library, and all other objects are ignored.
+    The path ends at the earliest time from which the agent can stay at the goal cell forever. If goal_cell is None,
+    the agent has no goal and the path ends as soon as the agent can stay in its cell forever.
+    Returns the list of cells of the agent at times 0, 1, ..., and the list of actions taking it between them, or None
+    if there is no such path.
+    """
+    distances = level.distances_from(goal_cell) if goal_cell is not None else None
+    if (distances is not None and distances[start_cell] is None) or not constraints.allows(start_cell, start_cell, 0):
+        return None
+
+    # The Move actions by direction, and the NoOp action used for waiting, if any
+    moves = {action.agent_direction: action for action in action_library if isinstance(action, MoveAction)}
+    wait_action = next((action for action in action_library if isinstance(action, NoOpAction)), None)
+
+    # No constraint applies after the horizon, so a node at the horizon is completed by following the shortest path
+    # to the goal cell, which is exactly what the heuristic estimates. The search space is therefore finite.
+    horizon = constraints.max_time + 1
+
+    # The open list holds entries (f, -time, count, cell), where ties are broken in favour of the latest time. Every
+    # node has the cost of its time, so the parents of the (cell, time) nodes are recorded once when generated.
+    counter = itertools.count()
+    open_list = [(distances[start_cell] if distances is not None else 0, 0, next(counter), start_cell)]
+    parents = {(start_cell, 0): None}
+
+    while len(open_list) > 0:
+        _, negative_time, _, cell = heapq.heappop(open_list)
+        time = -negative_time
+
+        if time == horizon or ((goal_cell is None or cell == goal_cell) and time > constraints.last_time(cell)):
+            cells = [cell]
+            actions = []
+            entry = parents[(cell, time)]
+            while entry is not None:
+                (parent_cell, parent_time), action = entry
+                cells.append(parent_cell)
+                actions.append(action)
+                entry = parents[(parent_cell, parent_time)]
+            cells.reverse()
+            actions.reverse()
+            while distances is not None and cell != goal_cell:
+                for (direction, action) in moves.items():
+                    new_cell = level.neighbours[direction][cell]
+                    if new_cell != NO_CELL and distances[new_cell] == distances[cell] - 1:
+                        break
+                else:
+                    return None
+                cell = new_cell
+                cells.append(cell)
+                actions.append(action)
+            return cells, actions
+
+        successors = [(action, level.neighbours[direction][cell]) for (direction, action) in moves.items()]
+        if wait_action is not None:
+            successors.append((wait_action, cell))
+        for (action, new_cell) in successors:
+            if new_cell == NO_CELL or (new_cell, time + 1) in parents or \
+                    not constraints.allows(cell, new_cell, time + 1):
+                continue
+            h = 0
+            if distances is not None:
+                h = distances[new_cell]
+                if h is None:
+                    continue
+            parents[(new_cell, time + 1)] = ((cell, time), action)
+            heapq.heappush(open_list, (time + 1 + h, -(time + 1), next(counter), new_cell))
+
+    return None
@@ -14,16 +14,29 @@
 import argparse
 import memory
 import re
+import search_algorithms.graph_search
+import domains.hospital.heuristics
+import strategies.arastar
+import strategies.beam
+import strategies.idastar
+import agent_types.decentralised
+import agent_types.portfolio
 import sys
 from agent_types.classic import classic_agent_type
 from agent_types.serial import serial_agent_type
 from agent_types.decentralised import decentralised_agent_type
 from agent_types.helper import helper_agent_type
 from agent_types.non_deterministic import non_deterministic_agent_type
+from agent_types.portfolio import portfolio_agent_type
+from agent_types.independence_detection import independence_detection_agent_type
+from agent_types.cbs import cbs_agent_type
 from domains.hospital import *
 from strategies.bfs import FrontierBFS
 from strategies.dfs import FrontierDFS
 from strategies.bestfirst import FrontierAStar, FrontierGreedy
+from strategies.arastar import FrontierARAStar
+from strategies.beam import FrontierBeam
+from strategies.idastar import FrontierIDAStar
 
 from utils import read_line
 
@@ -44,6 +57,45 @@ def parse_command_line_arguments():
 
     parser.add_argument('--max-memory', metavar='<GB>', type=str, default="4g",
                         help='The maximum memory usage allowed in GB (soft limit, default 4g).')
+    parser.add_argument('--memory-sample-seconds', metavar='<s>', type=float, default=memory.sample_interval_seconds,
+                        help='The time between two samples of the memory usage during a search (default 0.1).')
+    parser.add_argument('--memory-sample-expansions', metavar='<N>', type=int,
+                        default=memory.sample_interval_expansions,
+                        help='The maximum number of expansions between two samples of the memory usage (default 1000).')
+    parser.add_argument('--early-goal-test', action='store_true',
+                        help='Test states for goals when they are generated (always on for BFS, ignored for A*).')
+    parser.add_argument('--deferred-evaluation', action='store_true',
+                        help='Evaluate the heuristic for states when they are expanded (only for -greedy).')
+    parser.add_argument('--heuristic-cache-size', metavar='<N>', type=int,
+                        default=domains.hospital.heuristics.default_cache_size,
+                        help='Cache the values of -advancedheuristic for up to this number of box configurations'
+                             ' (default 0, i.e. disabled).')
+    parser.add_argument('--transposition-table-size', metavar='<N>', type=int,
+                        default=strategies.idastar.default_transposition_table_size,
+                        help='The maximum number of states in the transposition table of -idastar (default 100000).')
+    parser.add_argument('--bidirectional', action='store_true',
+                        help='Search from both the initial and the goal state with -bfs or -astar on single-agent'
+                             ' levels.')
+    parser.add_argument('--workers', metavar='<N>', type=int, default=1,
+                        help='The number of processes to distribute -astar and -greedy searches over (default 1).')
+    parser.add_argument('--time-budget', metavar='<s>', type=float, default=strategies.arastar.default_time_budget,
+                        help='The seconds since the start of the search after which -arastar stops improving its'
+                             ' plan (default 10).')
+    parser.add_argument('--initial-weight', metavar='<w>', type=float,
+                        default=strategies.arastar.default_initial_weight,
+                        help='The weight of the heuristic in the first search of -arastar (default 5).')
+    parser.add_argument('--beam-width', metavar='<K>', type=int, default=strategies.beam.default_beam_width,
+                        help='The number of states -beam keeps per depth layer (default 1000).')
+    parser.add_argument('--portfolio-configs', metavar='<configs>', type=str, default=None,
+                        help='The configurations raced by -portfolio as strategy[:heuristic[:actions]] separated by'
+                             ' commas (default bfs,greedy:advanced,astar:goalcount).')
+    parser.add_argument('--spill-directory', metavar='<dir>', type=str, default=None,
+                        help='Spill the closed table to this directory instead of stopping when out of memory'
+                             ' (implies --closed-table).')
+    parser.add_argument('--reservation-table', action='store_true',
+                        help='Make -decentralised agents plan in priority order around the cells reserved by others.')
+    parser.add_argument('--closed-table', action='store_true',
+                        help='Store closed states as compact (predecessor, action) records instead of a search tree.')
 
     strategy_group = parser.add_mutually_exclusive_group()
     strategy_group.add_argument('-bfs', action='store_const', dest='strategy', const='bfs',
@@ -54,6 +106,12 @@ def parse_command_line_arguments():
                                 help='Use the A* strategy.')
     strategy_group.add_argument('-greedy', action='store_const', dest='strategy', const='greedy',
                                 help='Use the Greedy strategy.')
+    strategy_group.add_argument('-idastar', action='store_const', dest='strategy', const='idastar',
+                                help='Use the iterative-deepening A* strategy.')
+    strategy_group.add_argument('-arastar', action='store_const', dest='strategy', const='arastar',
+                                help='Use the anytime repairing A* strategy.')
+    strategy_group.add_argument('-beam', action='store_const', dest='strategy', const='beam',
+                                help='Use the beam search strategy.')
 
     heuristic_group = parser.add_mutually_exclusive_group()
     heuristic_group.add_argument('-goalcount', action='store_const', dest='heuristic', const='goalcount',
@@ -76,8 +134,15 @@ def parse_command_line_arguments():
                                   help='Use a decentralised agent type.')
     agent_type_group.add_argument('-helper', action='store_const', dest='agent_type', const='helper',
                                   help='Use a helper agent type.')
-    agent_type_group.add_argument('-nondeterministic', action='store_const', dest='agent_type', const='nondeterministic',
+    agent_type_group.add_argument('-nondeterministic', action='store_const', dest='agent_type',
+                                  const='nondeterministic',
                                   help='Use a non deterministic agent type.')
+    agent_type_group.add_argument('-independence', action='store_const', dest='agent_type', const='independence',
+                                  help='Use an agent type planning for independent groups of agents separately.')
+    agent_type_group.add_argument('-cbs', action='store_const', dest='agent_type', const='cbs',
+                                  help='Use an agent type planning with conflict-based search on levels without boxes.')
+    agent_type_group.add_argument('-portfolio', action='store_const', dest='agent_type', const='portfolio',
+                                  help='Race several search configurations in parallel and use the first plan found.')
 
     args = parser.parse_args()
 
@@ -88,10 +153,85 @@ def parse_command_line_arguments():
         sys.exit(-1)
     max_memory_gb = int(max_memory_gb_match.group(1))
     memory.max_usage = max_memory_gb * 1024 * 1024 * 1024
+    memory.sample_interval_seconds = args.memory_sample_seconds
+    memory.sample_interval_expansions = args.memory_sample_expansions
+
+    search_algorithms.graph_search.use_closed_table = args.closed_table or args.spill_directory is not None
+    search_algorithms.graph_search.spill_directory = args.spill_directory
+    search_algorithms.graph_search.use_bidirectional = args.bidirectional
+    search_algorithms.graph_search.num_workers = args.workers
+
+    # The early goal test is safe for DFS and greedy best-first search, but not for A* since it breaks optimality
+    if args.early_goal_test:
+        FrontierDFS.early_goal_test = True
+        FrontierGreedy.early_goal_test = True
+    # Deferred heuristic evaluation breaks optimality too, so it is only enabled for greedy best-first search
+    FrontierGreedy.deferred_evaluation = args.deferred_evaluation
+
+    strategies.idastar.default_transposition_table_size = args.transposition_table_size
+    domains.hospital.heuristics.default_cache_size = args.heuristic_cache_size
+    strategies.arastar.default_time_budget = args.time_budget
+    strategies.arastar.default_initial_weight = args.initial_weight
+    strategies.beam.default_beam_width = args.beam_width
+
+    agent_types.decentralised.use_reservation_table = args.reservation_table
+
+    if args.portfolio_configs is not None:
+        try:
+            agent_types.portfolio.configurations = agent_types.portfolio.parse_configurations(args.portfolio_configs)
+        except ValueError as error:
+            print(f"Failed to parse portfolio configurations: {error}", file=sys.stderr)
+            sys.exit(-1)
 
     return args.strategy, args.heuristic, args.action_library, args.agent_type
 
 
+def construct_action_library(action_library_name):
+    """Constructs the requested hospital action library, or returns None if the name is not recognized"""
+    if action_library_name == 'default':
+        return DEFAULT_HOSPITAL_ACTION_LIBRARY
+    elif action_library_name == 'sticky':
+        return STICKY_HOSPITAL_ACTION_LIBRARY
+    return None
+
+
+def construct_heuristic(heuristic_name, level):
+    """Constructs the requested hospital heuristic, preprocessed for the level, or returns None if there is none"""
+    heuristic = None
+    if heuristic_name == 'goalcount':
+        heuristic = HospitalGoalCountHeuristics()
+    elif heuristic_name == 'advanced':
+        heuristic = HospitalAdvancedHeuristics()
+
+    # Some heuristics needs to preprocess the level to pre-compute distance lookup tables, matchings, etc.
+    if heuristic is not None:
+        heuristic.preprocess(level)
+    # Heuristics which only depend on part of the state remember their values for that part (see HeuristicCache)
+    if hasattr(heuristic, 'cache_key') and domains.hospital.heuristics.default_cache_size > 0:
+        heuristic = HeuristicCache(heuristic)
+    return heuristic
+
+
+def construct_frontier(strategy_name, heuristic):
+    """Constructs the frontier of the requested strategy, or returns None if the strategy is not recognized"""
+    if strategy_name == 'bfs':
+        return FrontierBFS()
+    elif strategy_name == 'dfs':
+        return FrontierDFS()
+    elif strategy_name == 'astar':
+        return FrontierAStar(heuristic)
+    elif strategy_name == 'greedy':
+        return FrontierGreedy(heuristic)
+    elif strategy_name == 'idastar':
+        return FrontierIDAStar(heuristic)
+    elif strategy_name == 'arastar':
+        return FrontierARAStar(heuristic)
+    elif strategy_name == 'beam':
+        return FrontierBeam(heuristic)
+    print(f"Unrecognized strategy {strategy_name}", file=sys.stderr)
+    return None
+
+
 if __name__ == '__main__':
 
     strategy_name, heuristic_name, action_library_name, agent_type_name = parse_command_line_arguments()
@@ -123,39 +263,16 @@ if __name__ == '__main__':
         initial_state = HospitalState(level, level.initial_agent_positions, level.initial_box_positions)
         goal_description = HospitalGoalDescription(level, level.box_goals + level.agent_goals)
 
-        # Construct the requested action library
-        if action_library_name == 'default':
-            action_library = DEFAULT_HOSPITAL_ACTION_LIBRARY
-        elif action_library_name == 'sticky':
-            action_library = STICKY_HOSPITAL_ACTION_LIBRARY
-
-        # Construct the requested heuristic
-        if heuristic_name == 'goalcount':
-            heuristic = HospitalGoalCountHeuristics()
-        elif heuristic_name == 'advanced':
-            heuristic = HospitalAdvancedHeuristics()
-
-    # Some heuristics needs to preprocess the level to pre-compute distance lookup tables, matchings, etc.
-    if heuristic is not None:
-        heuristic.preprocess(level)
-
-    # Construct the requested frontier
-    frontier = None
+        # Construct the requested action library and heuristic
+        action_library = construct_action_library(action_library_name)
+        heuristic = construct_heuristic(heuristic_name, level)
 
     # If no specific strategy is requested, we implicitly assume it to be a BFS
     if strategy_name is None:
         strategy_name = 'bfs'
 
-    if strategy_name == 'bfs':
-        frontier = FrontierBFS()
-    elif strategy_name == 'dfs':
-        frontier = FrontierDFS()
-    elif strategy_name == 'astar':
-        frontier = FrontierAStar(heuristic)
-    elif strategy_name == 'greedy':
-        frontier = FrontierGreedy(heuristic)
-    else:
-        print(f"Unrecognized strategy {strategy_name}", file=sys.stderr)
+    # Construct the requested frontier
+    frontier = construct_frontier(strategy_name, heuristic)
 
     # If no specific agent type is requested, we implicitly assume it to be the "classic" type
     if agent_type_name is None:
@@ -172,6 +289,22 @@ if __name__ == '__main__':
         helper_agent_type(level, initial_state, action_library, goal_description, frontier)
     elif agent_type_name == 'nondeterministic':
         non_deterministic_agent_type(level, initial_state, action_library, goal_description)
+    elif agent_type_name == 'independence':
+        independence_detection_agent_type(level, initial_state, action_library, goal_description, frontier)
+    elif agent_type_name == 'cbs':
+        cbs_agent_type(level, initial_state, goal_description)
+    elif agent_type_name == 'portfolio':
+        # Every configuration of the portfolio gets its own action library, heuristic and frontier
+        portfolio = []
+        for (portfolio_strategy_name, portfolio_heuristic_name, portfolio_action_library_name) in \
+                agent_types.portfolio.configurations:
+            portfolio_name = ":".join(filter(lambda name: name is not None,
+                                             [portfolio_strategy_name, portfolio_heuristic_name,
+                                              portfolio_action_library_name]))
+            portfolio_heuristic = construct_heuristic(portfolio_heuristic_name, level)
+            portfolio.append((portfolio_name, construct_action_library(portfolio_action_library_name),
+                              construct_frontier(portfolio_strategy_name, portfolio_heuristic)))
+        portfolio_agent_type(level, initial_state, goal_description, portfolio)
     else:
         print(f"Unrecognized agent type! {agent_type_name}", file=sys.stderr)
 
@@ -0,0 +1,90 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from strategies.bestfirst import FrontierBestFirst, PriorityQueue
+
+# The defaults of the anytime search, i.e. the weight of the first search, the amount the weight is lowered by after
+# each plan found, and the wall-clock time in seconds the search may continue to improve its plan.
+# The searchclient sets these from the command line.
+default_initial_weight = 5.0
+default_weight_step = 0.5
+default_time_budget = 10.0
+
+
+class FrontierARAStar(FrontierBestFirst):
+    """
+    The frontier of an anytime repairing A* search (see anytime_search in graph_search.py), which orders the states by
+    g + weight * h. The weight starts at initial_weight and is lowered by weight_step after every plan found, until it
+    reaches 1 or time_budget seconds have passed since the search started.
+    The heuristic values are remembered, such that the frontier can be reordered for a new weight without evaluating
+    the heuristic again. Since the priorities are not integral and states are reordered, the frontier uses a
+    PriorityQueue rather than a BucketPriorityQueue.
+    """
+
+    def __init__(self, heuristic, initial_weight=None, weight_step=None, time_budget=None):
+        super().__init__()
+        self.queue = PriorityQueue()
+        self.heuristic = heuristic
+        self.initial_weight = default_initial_weight if initial_weight is None else initial_weight
+        self.weight_step = default_weight_step if weight_step is None else weight_step
+        self.time_budget = default_time_budget if time_budget is None else time_budget
+        self.weight = self.initial_weight
+        self.h_values = {}
+
+    def prepare(self, goal_description):
+        super().prepare(goal_description)
+        self.weight = self.initial_weight
+        self.h_values.clear()
+
+    def h(self, state):
+        h = self.h_values.get(state)
+        if h is None:
+            h = self.heuristic.h(state, self.goal_description)
+            self.h_values[state] = h
+        return h
+
+    def f(self, state, goal_description):
+        return state.path_cost + self.weight * self.h(state)
+
+    def add(self, state):
+        # The heuristic values are remembered, so the states are added one by one rather than in batches
+        self.queue.add(state, self.f(state, self.goal_description))
+
+    def add_all(self, states):
+        for state in states:
+            self.add(state)
+
+    def min_f(self):
+        return self.queue.min_priority()
+
+    def contains(self, state):
+        return self.queue.contains(state)
+
+    def update(self, state):
+        """Adds the state, or replaces the state in the frontier which is equal to it but has a higher path cost"""
+        if self.queue.contains(state):
+            self.queue.change_priority(state, self.f(state, self.goal_description))
+        else:
+            self.add(state)
+
+    def lower_weight(self, inconsistent_states):
+        """
+        Lowers the weight by weight_step, but not below 1, and reorders the frontier for the new weight. The
+        inconsistent states, i.e. closed states reached by a cheaper path since they were expanded, are added as well.
+        """
+        self.weight = max(1.0, self.weight - self.weight_step)
+        states = self.queue.elements()
+        states.extend(inconsistent_states)
+        self.queue.clear()
+        for state in states:
+            self.add(state)
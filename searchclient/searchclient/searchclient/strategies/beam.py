@@ -0,0 +1,91 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import itertools
+from collections import OrderedDict
+
+# The default number of states kept per depth layer and the default maximum number of states in the table used to
+# detect duplicates. The searchclient sets the beam width from the command line.
+default_beam_width = 1000
+default_table_size = 1000000
+
+
+class FrontierBeam:
+    """
+    A beam search frontier, which only keeps the beam_width states with the lowest heuristic values of each depth
+    layer. Since graph_search expands all states of a layer before any state of the next layer, the frontier only
+    holds the current layer and the best children seen for the next layer, so at most beam_width states are expanded
+    per layer, whatever the size of the level. The search is incomplete, since it discards states.
+    Duplicates are detected through a table of the most recently added states, which is bounded by table_size.
+    """
+
+    # The search is not optimal anyway, so it may as well stop at the first goal state generated
+    early_goal_test = True
+    # The frontier holds the states themselves and detects duplicates on its own (see FrontierBFS)
+    stores_keys = False
+
+    def __init__(self, heuristic, beam_width=None, table_size=None):
+        self.heuristic = heuristic
+        self.beam_width = default_beam_width if beam_width is None else beam_width
+        self.table_size = default_table_size if table_size is None else table_size
+        self.goal_description = None
+        # The states of the current layer, sorted such that the state with the lowest heuristic value is last
+        self.layer = []
+        # The best children for the next layer as a heap of entries (-h, -count, state), i.e. the worst one is first
+        self.next_layer = []
+        self.counter = itertools.count()
+        self.table = OrderedDict()
+
+    def prepare(self, goal_description):
+        # Prepare is called at the beginning of a search and since we will sometimes reuse frontiers for multiple
+        # searches, prepares must ensure that state is cleared.
+        self.goal_description = goal_description
+        self.layer.clear()
+        self.next_layer.clear()
+        self.counter = itertools.count()
+        self.table.clear()
+
+    def add(self, state):
+        self.add_all([state])
+
+    def add_all(self, states):
+        # The heuristic values of all the states, i.e. the children of an expansion, are evaluated at once
+        for (state, h) in zip(states, self.heuristic.h_batch(states, self.goal_description)):
+            entry = (-h, -next(self.counter), state)
+            if len(self.next_layer) < self.beam_width:
+                heapq.heappush(self.next_layer, entry)
+            else:
+                # The worst of the children and the new state is dropped
+                heapq.heappushpop(self.next_layer, entry)
+
+            self.table[state] = None
+            self.table.move_to_end(state)
+            if len(self.table) > self.table_size:
+                self.table.popitem(last=False)
+
+    def pop(self):
+        # Once the current layer has been expanded, the best children become the current layer
+        if len(self.layer) == 0:
+            self.layer = [state for (_, _, state) in sorted(self.next_layer)]
+            self.next_layer.clear()
+        return self.layer.pop()
+
+    def is_empty(self):
+        return len(self.layer) == 0 and len(self.next_layer) == 0
+
+    def size(self):
+        return len(self.layer) + len(self.next_layer)
+
+    def contains(self, state):
+        return state in self.table
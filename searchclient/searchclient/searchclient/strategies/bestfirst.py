@@ -61,6 +61,12 @@ class PriorityQueue:
         self.entry_finder.pop(state)
         return state
 
+    def min_priority(self):
+        # Invalidated entries at the front of the queue are discarded, such that the front entry is a valid one
+        while self.heap[0][2] is None:
+            heapq.heappop(self.heap)
+        return self.heap[0][0]
+
     def clear(self):
         self.heap.clear()
         self.entry_finder.clear()
@@ -75,13 +81,117 @@ class PriorityQueue:
             return None
         return entry[0]
 
+    def contains(self, element):
+        return element in self.entry_finder
+
+    def elements(self):
+        return list(self.entry_finder)
+
+
+class BucketPriorityQueue:
+    """
+    A priority queue for priorities (f, h) of small non-negative integers, such as the f and h values of a search where
+    all actions cost the same. The elements are kept in a bucket per f value, which is a list of sub-buckets indexed by
+    h, from which the elements are popped in LIFO order, and where None marks an empty sub-bucket. The lowest priority
+    is found by moving a pointer to f and a pointer to h up past the empty (sub-)buckets. The pointers only move down
+    when an element with a lower priority is added, so adding takes constant time, and popping takes amortised
+    constant time as long as the priorities of the added elements rarely drop below the lowest one, e.g. for A* with a
+    consistent heuristic.
+    Unlike PriorityQueue, the priority of an element cannot be changed.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.min_f = 0
+        # The lowest h of an element in the bucket of min_f
+        self.min_h = 0
+        self.num_elements = 0
+
+    def add(self, element, priority):
+        f, h = priority
+        sub_buckets = self.buckets.get(f)
+        if sub_buckets is None:
+            sub_buckets = self.buckets[f] = []
+        if h >= len(sub_buckets):
+            sub_buckets.extend([None] * (h + 1 - len(sub_buckets)))
+        sub_bucket = sub_buckets[h]
+        if sub_bucket is None:
+            sub_buckets[h] = [element]
+        else:
+            sub_bucket.append(element)
+        if self.num_elements == 0 or f < self.min_f:
+            self.min_f = f
+            self.min_h = h
+        elif f == self.min_f and h < self.min_h:
+            self.min_h = h
+        self.num_elements += 1
+
+    def skip_empty_buckets(self):
+        """Moves the pointers to the lowest priority of an element in the queue, which must not be empty"""
+        while True:
+            sub_buckets = self.buckets.get(self.min_f)
+            if sub_buckets is not None:
+                while self.min_h < len(sub_buckets) and not sub_buckets[self.min_h]:
+                    self.min_h += 1
+                if self.min_h < len(sub_buckets):
+                    return sub_buckets[self.min_h]
+                del self.buckets[self.min_f]
+            self.min_f += 1
+            self.min_h = 0
+
+    def pop(self):
+        if self.num_elements == 0:
+            raise IndexError('pop from an empty priority queue')
+        self.num_elements -= 1
+        # Most pops take from the same sub-bucket as the previous one
+        sub_buckets = self.buckets.get(self.min_f)
+        if sub_buckets is not None and self.min_h < len(sub_buckets) and sub_buckets[self.min_h]:
+            return sub_buckets[self.min_h].pop()
+        return self.skip_empty_buckets().pop()
+
+    def min_priority(self):
+        if self.num_elements == 0:
+            return None
+        self.skip_empty_buckets()
+        return self.min_f, self.min_h
+
+    def clear(self):
+        self.buckets.clear()
+        self.min_f = 0
+        self.min_h = 0
+        self.num_elements = 0
+
+    def size(self):
+        return self.num_elements
+
+    def elements(self):
+        return [element for sub_buckets in self.buckets.values() for sub_bucket in sub_buckets
+                if sub_bucket is not None for element in sub_bucket]
+
 
 class FrontierBestFirst:
 
+    # Whether graph_search tests states for goals when they are generated. It must stay disabled for A*, since the
+    # first generated goal state is not necessarily an optimal one, but it is safe to enable for greedy best-first
+    # search.
+    early_goal_test = False
+    # The frontier holds the states themselves, since their priorities are computed from them (see FrontierBFS)
+    stores_keys = False
+    # Whether the heuristic is evaluated for the states when they are popped instead of when they are added. The states
+    # are then queued with the heuristic value of the state popped last, which graph_search always expands right before
+    # adding its children, i.e. the value of their parent. This saves evaluating the heuristic for the states which are
+    # never expanded, at the expense of less informed priorities. It breaks the optimality of A*.
+    deferred_evaluation = False
+
     def __init__(self):
         self.goal_description = None
-        self.queue = PriorityQueue()
-        self.set = set()
+        self.queue = BucketPriorityQueue()
+        # The states in the queue, which is only kept once contains has been called, since only graph_search needs it
+        self.set = None
+        # The heuristic values are multiplied by this to get integral priorities (see heuristic.resolution)
+        self.h_scale = 1
+        # The heuristic value of the state popped last with deferred evaluation
+        self.popped_h = None
 
 
     def prepare(self, goal_description):
@@ -89,20 +199,40 @@ class FrontierBestFirst:
         # Prepare is called at the beginning of a search and since we will sometimes reuse frontiers 
         # for multiple  searches, prepares must ensure that state is cleared.
         self.queue.clear()
-        self.set.clear()
+        self.set = None
+        self.popped_h = None
+        if hasattr(self.heuristic, 'resolution'):
+            self.h_scale = self.heuristic.resolution(goal_description)
 
     def f(self, state, goal_description):
         raise Exception("FrontierBestFirst should not be directly used. Instead use a subclass overriding f()")
 
+    def priority(self, state, h):
+        raise Exception("FrontierBestFirst should not be directly used. Instead use a subclass overriding priority()")
+
     def add(self, state):
-        # calculate priority of state and add to queue
-        priority = self.f(state,self.goal_description)
-        self.queue.add(state,priority)
-        self.set.add(state)
+        self.add_all([state])
+
+    def add_all(self, states):
+        # The heuristic values of all the states, i.e. the children of an expansion, are evaluated at once (see
+        # h_batch). With deferred evaluation, they are queued with the value of their parent instead. The initial state
+        # is added before any state is popped, so it is always evaluated.
+        if self.deferred_evaluation and self.popped_h is not None:
+            h_values = itertools.repeat(self.popped_h)
+        else:
+            h_values = self.heuristic.h_batch(states,self.goal_description)
+        # calculate priority of each state and add to queue
+        for (state, h) in zip(states, h_values):
+            self.queue.add(state,self.priority(state,h))
+        if self.set is not None:
+            self.set.update(states)
 
     def pop(self):
         state = self.queue.pop()
-        self.set.remove(state)
+        if self.set is not None:
+            self.set.remove(state)
+        if self.deferred_evaluation:
+            self.popped_h = self.heuristic.h(state,self.goal_description)
         return state
 
     def is_empty(self):
@@ -112,12 +242,14 @@ class FrontierBestFirst:
         return self.queue.size()
     
     def contains(self, state):
+        if self.set is None:
+            self.set = set(self.queue.elements())
         return state in self.set
 
 
 
 # The FrontierAStar and FrontierGreedy classes extend the FrontierBestFirst class, that is, they are
-# exact copies of the above class but where the 'f' method is replaced.
+# exact copies of the above class but where the 'f' and 'priority' methods are replaced.
 
 class FrontierAStar(FrontierBestFirst):
 
@@ -131,6 +263,12 @@ class FrontierAStar(FrontierBestFirst):
 
         return (g+h)
 
+    def priority(self, state, h):
+        # The queue needs integral priorities, so f and h are scaled by the resolution of the heuristic.
+        # Ties on f are broken in favour of the state with the lower h, i.e. the one closest to a goal
+        h = round(h * self.h_scale)
+        return (state.path_cost*self.h_scale+h, h)
+
 class FrontierGreedy(FrontierBestFirst):
 
     def __init__(self, heuristic):
@@ -139,3 +277,6 @@ class FrontierGreedy(FrontierBestFirst):
 
     def f(self, state, goal_description):
         return self.heuristic.h(state,goal_description)
+
+    def priority(self, state, h):
+        return (round(h * self.h_scale), 0)
@@ -16,35 +16,43 @@ from collections import deque
 
 class FrontierBFS:
 
+    # Breadth-first search finds the shallowest goal state anyway, so graph_search can test the states for goals
+    # already when they are generated instead of when they are expanded, which saves an entire layer of expansions
+    early_goal_test = True
+
+    # The frontier only holds the compact keys of the states (see state.key), so graph_search keeps a closed table
+    # of all generated states instead of the search tree (see closed_table_graph_search), which is also used to check
+    # whether a state is in the frontier.
+    stores_keys = True
+
     def __init__(self):
-        # We use both a deque and a set for the BFS implementation.
-        # Using the deque as a queue allows us to keep track of the ordering while the set allows us to perform
-        #e efficient membership checks, .g. whether some specific state is in the queue.
+        # The deque is used as a queue of state keys, and the states are rebuilt from their keys when they are popped.
+        # All states of a search share their characters, so any state of the search can rebuild the others.
         self.queue = deque()
-        self.set = set()
+        self.template_state = None
 
     def prepare(self, goal_description):
         # Prepare is called at the beginning of a search and since we will sometimes reuse frontiers for multiple
         # searches, prepares must ensure that state is cleared.
         self.queue.clear()
-        self.set.clear()
+        self.template_state = None
 
     def add(self, state):
+        if self.template_state is None:
+            self.template_state = state
         # Append adds to the tail of the queue
-        self.queue.append(state)
-        self.set.add(state)
+        self.queue.append(state.key())
+
+    def add_all(self, states):
+        for state in states:
+            self.add(state)
 
     def pop(self):
         # Popleft takes from the head of the queue
-        state = self.queue.popleft()
-        self.set.remove(state)
-        return state
+        return self.template_state.state_of_key(self.queue.popleft())
 
     def is_empty(self):
         return len(self.queue) == 0
 
     def size(self):
         return len(self.queue)
-
-    def contains(self, state):
-        return state in self.set
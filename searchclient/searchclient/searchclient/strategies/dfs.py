@@ -15,32 +15,38 @@ from collections import deque
 
 class FrontierDFS:
 
+    # Testing states for goals when they are generated is safe for DFS, but it is only done when requested
+    # (see graph_search)
+    early_goal_test = False
+
+    # Just like FrontierBFS, the frontier only holds the compact keys of the states
+    stores_keys = True
+
     def __init__(self):
         self.queue = deque()
-        self.set = set()
+        self.template_state = None
 
     def prepare(self, goal_description):
         # Prepare is called at the beginning of a search and since we will sometimes reuse frontiers for multiple
         # searches, prepares must ensure that state is cleared.
 
         self.queue.clear()
-        self.set.clear()
+        self.template_state = None
  
     def add(self, state):
-        self.queue.append(state)
-        self.set.add(state)
+        if self.template_state is None:
+            self.template_state = state
+        self.queue.append(state.key())
+
+    def add_all(self, states):
+        for state in states:
+            self.add(state)
   
     def pop(self):
-        state = self.queue.pop() # This one pops right 
-        self.set.remove(state)
-        return state
+        return self.template_state.state_of_key(self.queue.pop()) # This one pops right 
 
     def is_empty(self):
         return len(self.queue) == 0
 
     def size(self):
         return len(self.queue)
-
-    def contains(self, state):
-        return state in self.set
-
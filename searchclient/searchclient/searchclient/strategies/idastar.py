@@ -0,0 +1,105 @@
+# coding: utf-8
+#
+# Copyright 2021 The Technical University of Denmark
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#    http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+
+# The default maximum number of states in the transposition table, where 0 disables the table.
+# The searchclient sets this from the command line.
+default_transposition_table_size = 100000
+
+
+class FrontierIDAStar:
+    """
+    The frontier of an iterative-deepening A* search (see ida_star_search in graph_search.py).
+    Instead of all generated states, it only holds the path of the current depth-first iteration, which keeps the
+    memory usage linear in the plan length. Each entry on the path is a pair (state, children) where children yields
+    the remaining children of the state, or is None if the state has not been expanded yet.
+    Optionally, a transposition table of bounded size remembers the lowest path cost each state has been reached with
+    in the current iteration, such that the search is not repeated below a state reached again at the same or higher
+    cost. When the table is full, the least recently used entry is evicted.
+    """
+
+    # The goals are always tested when the states are expanded, since the first goal found within the cost bound is
+    # an optimal one
+    early_goal_test = False
+
+    def __init__(self, heuristic, transposition_table_size=None):
+        self.heuristic = heuristic
+        if transposition_table_size is None:
+            transposition_table_size = default_transposition_table_size
+        self.transposition_table_size = transposition_table_size
+        self.goal_description = None
+        self.path = []
+        self.path_states = set()
+        self.transposition_table = OrderedDict()
+
+    def prepare(self, goal_description):
+        # Prepare is called at the beginning of a search and since we will sometimes reuse frontiers for multiple
+        # searches, prepares must ensure that state is cleared.
+        self.goal_description = goal_description
+        self.path.clear()
+        self.path_states.clear()
+        self.transposition_table.clear()
+
+    def start_iteration(self, initial_state):
+        # The path costs in the transposition table were found with a lower cost bound, so they cannot be reused
+        self.path.clear()
+        self.path_states.clear()
+        self.transposition_table.clear()
+        self.push(initial_state)
+
+    def f(self, state):
+        return state.path_cost + self.heuristic.h(state, self.goal_description)
+
+    def push(self, state):
+        self.path.append((state, None))
+        self.path_states.add(state)
+
+    def pop(self):
+        state, _ = self.path.pop()
+        self.path_states.remove(state)
+        return state
+
+    def top(self):
+        return self.path[-1]
+
+    def set_children(self, children):
+        self.path[-1] = (self.path[-1][0], children)
+
+    def admit(self, state):
+        """Returns True iff the search should continue below the state, which must have been generated from the top"""
+        # Cycles along the path are never worth searching
+        if state in self.path_states:
+            return False
+        if self.transposition_table_size == 0:
+            return True
+        key = state.key()
+        best_path_cost = self.transposition_table.get(key)
+        if best_path_cost is not None and best_path_cost <= state.path_cost:
+            self.transposition_table.move_to_end(key)
+            return False
+        self.transposition_table[key] = state.path_cost
+        self.transposition_table.move_to_end(key)
+        if len(self.transposition_table) > self.transposition_table_size:
+            self.transposition_table.popitem(last=False)
+        return True
+
+    def is_empty(self):
+        return len(self.path) == 0
+
+    def size(self):
+        return len(self.path)
+
+    def num_stored(self):
+        """Returns the number of states held by the frontier, i.e. the path and the transposition table"""
+        return len(self.path) + len(self.transposition_table)
@@ -40,6 +40,31 @@ def parse_response(response):
     return [part == "true" for part in response.split('|')]
 
 
+class JointActionEncoder:
+    """
+    Encodes a joint action as a single integer, the index of the joint action among all combinations of actions in an
+    action set, and decodes such indices back into joint actions. This allows a search to store joint actions compactly.
+    """
+
+    def __init__(self, action_set):
+        self.action_set = action_set
+        self.action_indices = [{action: index for (index, action) in enumerate(actions)} for actions in action_set]
+
+    def encode(self, joint_action):
+        joint_action_id = 0
+        for agent_index in reversed(range(len(joint_action))):
+            joint_action_id *= len(self.action_set[agent_index])
+            joint_action_id += self.action_indices[agent_index][joint_action[agent_index]]
+        return joint_action_id
+
+    def decode(self, joint_action_id):
+        joint_action = []
+        for actions in self.action_set:
+            joint_action_id, index = divmod(joint_action_id, len(actions))
+            joint_action.append(actions[index])
+        return joint_action
+
+
 class GenericNoOp:
     """A NoOP action which is independent of a specific domain and
     therefore can be used inside domain-agnostic agent types"""
@@ -51,11 +76,11 @@ class GenericNoOp:
 
     def is_applicable(self, agent_index, state):
         # Optimization. NoOp can never change the state if we only have a single agent
-        return len(state.agent_positions) > 1
+        return len(state.agent_chars) > 1
 
     def result(self, agent_index, state):
         pass
 
     def conflicts(self, agent_index, state):
-        current_agent_position, _ = state.agent_positions[agent_index]
-        return [current_agent_position], []
+        current_agent_cell = state.agent_cell(agent_index)
+        return [current_agent_cell], []